@@ -107,6 +107,16 @@ WantedBy=multi-user.target
 EOL
 echo "Systemd service file for Artlite Opaq APP created."
 
+# Local applications reading the sensor broker have to be in this group
+groupadd -f artlite-sensors
+
+# Install the sensor broker service, it is not enabled: sender nodes share
+# their readings through the APP with "sensorBroker": true in their configuration
+BROKER_SERVICE_FILE_PATH="/lib/systemd/system/artlite-opaq-sensor-broker.service"
+echo "Installing the systemd service file for the sensor broker at $BROKER_SERVICE_FILE_PATH..."
+cp -f $ARTLITE_Opaq_DIR/artlite-opaq-sensor-broker.service $BROKER_SERVICE_FILE_PATH
+echo "Systemd service file for the sensor broker installed."
+
 # Create the service file for BLE Configurator
 BLE_SERVICE_FILE_PATH="/lib/systemd/system/artlite-opaq-ble-configurator-app.service"
 echo "Creating the systemd service file for BLE Configurator at $BLE_SERVICE_FILE_PATH..."
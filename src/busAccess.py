@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import fcntl
+import tempfile
+import queue
+import threading
+from collections import deque
+from sensirion_i2c_driver import LinuxI2cTransceiver
+
+if sys.version_info[:2] == (3, 10):
+    import smbus2 as smbus
+else:
+    import smbus
+
+# Simulated hardware used instead of the Linux I2C devices, see use_hardware()
+_hardware = None
+
+# Lock files shared with other processes using the same I2C buses
+LOCK_DIR = '/run/lock'
+LOCK_FILE = 'artlite-i2c-{}.lock'
+
+# Longest wait for a bus before a transfer fails with TimeoutError
+BUS_TIMEOUT = 2.0
+
+
+
+class FlockRequest:
+    """
+    A blocking flock taken by the locker thread of a BusArbiter for the
+    thread that waits for it. If the waiting thread times out first, the
+    lock is released again as soon as the locker thread gets it.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.lock = threading.Lock()
+        self.granted = threading.Event()
+        self.cancelled = False
+        self.error = None
+
+    def wait(self, timeout):
+        if not self.granted.wait(timeout):
+            with self.lock:
+                if not self.granted.is_set():
+                    self.cancelled = True
+                    return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def grant(self, error = None):
+        with self.lock:
+            if self.cancelled:
+                if error is None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+                return
+            self.error = error
+            self.granted.set()
+
+
+class BusArbiter:
+    """
+    Exclusive access to one I2C bus for threads of this process and for
+    other processes.
+
+    Threads of this process queue in FIFO order, so a thread waiting for
+    the bus is served before threads that ask later. The thread at the
+    head of the queue then takes an flock on the bus lock file, which
+    other processes that use the same lock file respect. Between processes
+    the kernel decides who gets the bus next, that order is not FIFO. An
+    uncontended flock is taken directly. Otherwise a locker thread waits
+    for it in a blocking flock, so waiting costs no CPU, while the
+    requesting thread waits with the timeout. Waiting gives up after the
+    timeout with TimeoutError.
+
+    The arbiter is reentrant: the thread holding it can enter it again,
+    and it is released when the outermost use ends. Use it as a context
+    manager around one transfer.
+
+    Parameters:
+    busNo (int): I2C bus number.
+    timeout (float): Default wait limit in seconds.
+    """
+
+    def __init__(self, busNo, timeout = BUS_TIMEOUT):
+        self.busNo = busNo
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.waiters = deque()
+        self.owner = None
+        self.depth = 0
+        self.fd = None
+        self.pid = None
+        self.requests = queue.Queue()
+        self.locker = None
+        self.lockerPid = None
+        # Guards the direct flock against a cancelled request releasing the same lock file
+        self.flockGuard = threading.Lock()
+        self.pending = 0
+
+    def lock_file(self):
+        # A forked child must not share the parent's open lock file
+        if self.fd is None or self.pid != os.getpid():
+            lockDir = LOCK_DIR if os.access(LOCK_DIR, os.W_OK) else tempfile.gettempdir()
+            self.fd = os.open(os.path.join(lockDir, LOCK_FILE.format(self.busNo)), os.O_RDWR | os.O_CREAT, 0o666)
+            self.pid = os.getpid()
+        return self.fd
+
+    def run_locker(self):
+        while True:
+            request = self.requests.get()
+            try:
+                fcntl.flock(request.fd, fcntl.LOCK_EX)
+                error = None
+            except OSError as e:
+                error = e
+            with self.flockGuard:
+                request.grant(error)
+                self.pending -= 1
+
+    def lock_process(self, deadline):
+        fd = self.lock_file()
+        with self.flockGuard:
+            if self.pending == 0:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return
+                except BlockingIOError:
+                    pass
+            # Threads do not survive a fork, a child starts its own locker
+            if self.locker is None or self.lockerPid != os.getpid():
+                self.requests = queue.Queue()
+                self.pending = 0
+                self.locker = threading.Thread(target = self.run_locker, name = f'i2c-{self.busNo}-locker', daemon = True)
+                self.lockerPid = os.getpid()
+                self.locker.start()
+            request = FlockRequest(fd)
+            self.pending += 1
+            self.requests.put(request)
+        if not request.wait(max(deadline - time.monotonic(), 0)):
+            raise TimeoutError(f'I2C bus {self.busNo} busy in another process')
+
+    def acquire(self, timeout = None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        me = object()
+        with self.condition:
+            if self.owner == threading.get_ident():
+                self.depth += 1
+                return
+            self.waiters.append(me)
+            try:
+                while self.owner is not None or self.waiters[0] is not me:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f'I2C bus {self.busNo} busy in this process')
+                    self.condition.wait(remaining)
+            except BaseException:
+                self.waiters.remove(me)
+                self.condition.notify_all()
+                raise
+            self.waiters.popleft()
+            self.owner = threading.get_ident()
+
+        try:
+            self.lock_process(deadline)
+        except BaseException:
+            self.release_thread()
+            raise
+
+    def release_thread(self):
+        with self.condition:
+            self.owner = None
+            self.condition.notify_all()
+
+    def release(self):
+        with self.condition:
+            if self.depth > 0:
+                self.depth -= 1
+                return
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.release_thread()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+# One arbiter per I2C bus number, shared by every sensor on that bus
+_bus_locks = {}
+_bus_locks_guard = threading.Lock()
+
+def get_bus_lock(busNo):
+    with _bus_locks_guard:
+        if busNo not in _bus_locks:
+            _bus_locks[busNo] = BusArbiter(busNo)
+        return _bus_locks[busNo]
+
+
+class LockedSMBus:
+    """
+    Wraps an smbus.SMBus so that every call holds the BusArbiter of its bus.
+
+    Only single transfers are serialised. Sleeps between a measure command
+    and the following read happen outside the lock, so other sensors on
+    the same bus can use it in the meantime.
+    """
+
+    def __init__(self, bus, lock):
+        self._bus = bus
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attr = getattr(self._bus, name)
+        if not callable(attr):
+            return attr
+
+        def locked_call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return locked_call
+
+
+class LockedI2cTransceiver:
+    """
+    I2C transceiver (sensirion-i2c-driver API version 1) that holds the
+    BusArbiter for the write and for the read of a command, but not for the
+    read delay in between.
+    """
+    API_VERSION = 1
+    STATUS_OK = 0
+
+    def __init__(self, transceiver, lock):
+        self._transceiver = transceiver
+        self._lock = lock
+
+    @property
+    def description(self):
+        return self._transceiver.description
+
+    @property
+    def channel_count(self):
+        return self._transceiver.channel_count
+
+    def open(self):
+        self._transceiver.open()
+
+    def close(self):
+        self._transceiver.close()
+
+    def transceive(self, slave_address, tx_data, rx_length, read_delay, timeout):
+        with self._lock:
+            result = self._transceiver.transceive(slave_address, tx_data, None, 0, timeout)
+        if result[0] != self.STATUS_OK or rx_length is None:
+            return result
+
+        if read_delay > 0:
+            time.sleep(read_delay)
+
+        with self._lock:
+            return self._transceiver.transceive(slave_address, None, rx_length, 0, timeout)
+
+
+def use_hardware(hardware):
+    """
+    Open the buses of hardware (e.g. simulatedHardware.SimulatedHardware)
+    instead of /dev/i2c-*, None switches back to the real devices.
+    """
+    global _hardware
+    _hardware = hardware
+
+
+def open_smbus(busNo):
+    if _hardware is not None:
+        return LockedSMBus(_hardware.open_smbus(busNo), get_bus_lock(busNo))
+    return LockedSMBus(smbus.SMBus(busNo), get_bus_lock(busNo))
+
+def open_transceiver(busNo):
+    if _hardware is not None:
+        return LockedI2cTransceiver(_hardware.open_transceiver(busNo), get_bus_lock(busNo))
+    return LockedI2cTransceiver(LinuxI2cTransceiver('/dev/i2c-' + str(busNo)), get_bus_lock(busNo))
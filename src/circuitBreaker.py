@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+CLOSED = 'closed'       # sensor is read normally
+OPEN = 'open'           # sensor is skipped until the backoff has expired
+HALF_OPEN = 'half-open' # one probe read is allowed
+
+
+class CircuitBreaker:
+    """
+    Stops probing a failing sensor and retries it with exponential backoff.
+
+    After failure_threshold consecutive failures the breaker opens and
+    allow() returns False for base_backoff seconds. The next call after
+    that lets a single probe through; a failed probe opens the breaker
+    again with twice the previous backoff, up to max_backoff. A success
+    closes the breaker and resets the backoff.
+
+    Parameters:
+    name (str): Sensor name used in log messages.
+    failure_threshold (int): Consecutive failures before the breaker opens.
+    base_backoff (float): First backoff in seconds.
+    max_backoff (float): Upper limit of the backoff in seconds.
+    """
+
+    def __init__(self, name, failure_threshold = 3, base_backoff = 10, max_backoff = 3600):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.retry_at:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f'{self.name} recovered, circuit closed')
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                backoff = min(self.base_backoff * 2 ** self.trips, self.max_backoff)
+                self.trips += 1
+                self.state = OPEN
+                self.retry_at = time.monotonic() + backoff
+                print(f'{self.name} failed {self.failures} times, circuit open for {backoff} s')
+
+    def status(self):
+        """
+        Returns:
+        dict: state, consecutive failures and seconds until the next probe.
+        """
+        with self.lock:
+            retry_in = max(0, self.retry_at - time.monotonic()) if self.state == OPEN else 0
+            return {'state': self.state, 'failures': self.failures, 'retry_in': round(retry_in, 1)}
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import time
+
+
+class Deadline:
+    """
+    Point in time from which a device is ready again, e.g. the datasheet
+    wait after a command or until an ADC conversion is done.
+
+    Take the deadline right after the command and wait() only when the
+    result is needed: whatever was done in between counts towards the
+    wait. wait() sleeps on the monotonic clock, so it costs no CPU, does
+    not depend on the CPU clock, and as no bus lock is held while
+    sleeping the waits of sensors read by different threads overlap.
+
+    Parameters:
+    seconds (float): Time from now until the deadline.
+    """
+
+    def __init__(self, seconds = 0):
+        self.time = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.time - time.monotonic(), 0)
+
+    def expired(self):
+        return self.remaining() == 0
+
+    def wait(self):
+        remaining = self.remaining()
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def wait(seconds):
+    """
+    Sleep for a datasheet wait that has nothing to overlap with.
+    """
+    Deadline(seconds).wait()
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
+import re
 import time
+import select
 import argparse
 import sys
 import json
+import numpy as np
 
 
 #for reference to SGX MICS-6814 sensor look at https://teams.microsoft.com/l/file/F1AF367D-E383-4058-BF6C-B59D0514E52A?tenantId=ef5926db-9bdf-4f9f-9066-d8e7f03943f7&fileType=pdf&objectUrl=https%3A%2F%2Farcelik.sharepoint.com%2Fteams%2FC-AIRUCLA%2FShared%20Documents%2FGeneral%2FDonan%C4%B1m%2FDatasheet%2FSGX-6814-rev-8.pdf&baseUrl=https%3A%2F%2Farcelik.sharepoint.com%2Fteams%2FC-AIRUCLA&serviceName=teams&threadId=19:dc5e5b9ac9cc4d49b2ef5ec90748f095@thread.skype&groupId=7cfa0503-c29f-4147-a5c7-e088994d1bfb
@@ -20,7 +24,16 @@ NH3_data_lower_limit = 0
 NO2_data_upper_limit = 500
 NO2_data_lower_limit = 0
 
+# IIO buffered capture
+CAPTURE_SAMPLES = 64        # samples per read_capture()
+CAPTURE_BUFFER_LENGTH = 256 # kernel buffer length in samples
+CAPTURE_TIMEOUT = 2         # seconds to wait for a block of samples
+
+# Scan element type, e.g. "le:u12/16>>0": endianness, sign, bits, storage bits, repeat, shift
+SCAN_TYPE = re.compile(r'(le|be):([su])(\d+)/(\d+)(?:X(\d+))?>>(\d+)')
+
 def init(pathCO_IN, pathNH3_IN, pathN02_IN):
+    global adcPATH_CO, adcPATH_NH3, adcPATH_NO2
 
     adcPATH_CO = pathCO_IN
     adcPATH_NH3 = pathNH3_IN
@@ -29,35 +42,33 @@ def init(pathCO_IN, pathNH3_IN, pathN02_IN):
 
 # for formulatons and load resitance values look at  https://arcelik.sharepoint.com/teams/C-AIRUCLA/_layouts/15/Doc.aspx?OR=teams&action=edit&sourcedoc={8A6729F8-137A-4114-802A-99A298283AB4}
 
-def readADC_CO():
-    with open(adcPATH_CO, 'r') as f:
-        data = f.read()
-    
+def convert_CO(raw):
     #CO FORMULATIONS
-        ##CO_ppm=0.41366 * float(data) -345.41 +1
-        CO_ppm=pow(float(data)/4.0, -1.179) * 4.385
-    
-        return CO_ppm
+    ##CO_ppm=0.41366 * float(data) -345.41 +1
+    return np.power(np.asarray(raw, dtype=float)/4.0, -1.179) * 4.385
 
-def readADC_NH3():
-    with open(adcPATH_NH3, 'r') as f:
-        data = f.read()
-    
+def convert_NH3(raw):
     #NH3 FORMULATIONS
-        #NH3_ppm=0.09474 * float(data) -79.108 +1
-        NH3_ppm=pow(float(data)/4.0, -1.67) / 1.47
-        
-    return NH3_ppm
+    #NH3_ppm=0.09474 * float(data) -79.108 +1
+    return np.power(np.asarray(raw, dtype=float)/4.0, -1.67) / 1.47
 
-def readADC_NO2():
-    with open(adcPATH_NO2, 'r') as f:
-        data = f.read()
-    
+def convert_NO2(raw):
     #NO2 FORMULATIONS
-        #NO2_ppm=0.00399 * float(data) -5.0228+0.05
-        NO2_ppm=pow(float(data)/4.0, 1.007) / 6.855
-        
-    return NO2_ppm
+    #NO2_ppm=0.00399 * float(data) -5.0228+0.05
+    return np.power(np.asarray(raw, dtype=float)/4.0, 1.007) / 6.855
+
+def readADC(path):
+    with open(path, 'r') as f:
+        return float(f.read())
+
+def readADC_CO():
+    return float(convert_CO(readADC(adcPATH_CO)))
+
+def readADC_NH3():
+    return float(convert_NH3(readADC(adcPATH_NH3)))
+
+def readADC_NO2():
+    return float(convert_NO2(readADC(adcPATH_NO2)))
 
 def read():
     dataCO = readADC_CO()
@@ -66,22 +77,172 @@ def read():
     
     return dataCO, dataNH3, dataNO2
 
-def ftc_mode(file):
+class AdcCapture:
+    """
+    Buffered capture of the MICS-6814 ADC channels through the IIO
+    character device.
+
+    start() enables the scan elements of the three channels (and disables
+    all others), sets the buffer length and enables the buffer; the ADC
+    then fills the kernel buffer on every trigger. read() returns a block
+    of raw samples of all channels from one read of /dev/iio:deviceN.
+    The device needs a trigger (e.g. an hrtimer trigger); pass its name to
+    set it as current trigger, otherwise the configured one is kept.
 
-    bus = init(adcPATH_CO, adcPATH_NH3, adcPATH_NO2)
+    Parameters:
+    paths (list): Raw sysfs files of the CO, NH3 and NO2 channels, they
+    select the IIO device and its channels.
+    trigger (str): Name of the IIO trigger to use (optional).
+    devPath (str): Character device, /dev/<device> if not given.
+    bufferLength (int): Kernel buffer length in samples.
+    """
+
+    def __init__(self, paths, trigger=None, devPath=None, bufferLength=CAPTURE_BUFFER_LENGTH):
+        self.deviceDir = os.path.dirname(paths[0])
+        self.channels = [os.path.basename(path)[:-len('_raw')] for path in paths]
+        self.trigger = trigger
+        self.devPath = devPath if devPath is not None else os.path.join('/dev', os.path.basename(self.deviceDir))
+        self.bufferLength = bufferLength
+        self.fd = None
+        self.dtype = None
+        self.types = {}
+
+    def sysfs_write(self, name, value):
+        with open(os.path.join(self.deviceDir, name), 'w') as f:
+            f.write(str(value))
+
+    def sysfs_read(self, name):
+        with open(os.path.join(self.deviceDir, name), 'r') as f:
+            return f.read().strip()
+
+    def layout(self):
+        """
+        Build the numpy dtype of one scan from the enabled scan elements:
+        elements are ordered by index and aligned to their storage size.
+        """
+        elements = []
+        for name in os.listdir(os.path.join(self.deviceDir, 'scan_elements')):
+            if name.endswith('_en') and self.sysfs_read('scan_elements/' + name) == '1':
+                channel = name[:-len('_en')]
+                index = int(self.sysfs_read('scan_elements/{}_index'.format(channel)))
+                match = SCAN_TYPE.match(self.sysfs_read('scan_elements/{}_type'.format(channel)))
+                endian, sign, bits, storage, repeat, shift = match.groups()
+                self.types[channel] = (sign == 's', int(bits), int(shift))
+                elements.append((index, channel, ('<' if endian == 'le' else '>') + 'u' + str(int(storage) // 8)))
+
+        names, formats, offsets, offset, align = [], [], [], 0, 1
+        for index, channel, fmt in sorted(elements):
+            size = int(fmt[2:])
+            offset = (offset + size - 1) // size * size
+            names.append(channel)
+            formats.append(fmt)
+            offsets.append(offset)
+            offset += size
+            align = max(align, size)
+        itemsize = (offset + align - 1) // align * align
+        self.dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemsize})
+
+    def start(self):
+        self.sysfs_write('buffer/enable', 0)
+        for name in os.listdir(os.path.join(self.deviceDir, 'scan_elements')):
+            if name.endswith('_en'):
+                self.sysfs_write('scan_elements/' + name, 1 if name[:-len('_en')] in self.channels else 0)
+        self.layout()
+        if self.trigger is not None:
+            self.sysfs_write('trigger/current_trigger', self.trigger)
+        self.sysfs_write('buffer/length', self.bufferLength)
+        self.sysfs_write('buffer/enable', 1)
+        self.fd = os.open(self.devPath, os.O_RDONLY | os.O_NONBLOCK)
+
+    def read(self, samples=CAPTURE_SAMPLES, timeout=CAPTURE_TIMEOUT):
+        """
+        Returns:
+        numpy.ndarray: Raw values, one row per sample and one column per channel.
+        """
+        if self.fd is None:
+            self.start()
+        size = samples * self.dtype.itemsize
+        data = bytearray()
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        deadline = time.monotonic() + timeout
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                raise TimeoutError('IIO capture: {} of {} bytes'.format(len(data), size))
+            try:
+                chunk = os.read(self.fd, size - len(data))
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise IOError('IIO capture: end of data after {} of {} bytes'.format(len(data), size))
+            data += chunk
+
+        scans = np.frombuffer(bytes(data), dtype=self.dtype)
+        raw = np.empty((samples, len(self.channels)))
+        for column, channel in enumerate(self.channels):
+            signed, bits, shift = self.types[channel]
+            values = (scans[channel].astype(np.int64) >> shift) & ((1 << bits) - 1)
+            if signed:
+                values = np.where(values >= 1 << (bits - 1), values - (1 << bits), values)
+            raw[:, column] = values
+        return raw
+
+    def stop(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self.sysfs_write('buffer/enable', 0)
+
+
+def read_capture(capture, samples=CAPTURE_SAMPLES, oversample=False):
+    """
+    Read a block of samples and convert all of them at once.
+
+    Parameters:
+    capture (AdcCapture): Capture of the CO, NH3 and NO2 channels, in that order.
+    samples (int): Number of samples per channel.
+    oversample (bool): Average the raw values before the conversion, which
+    gains resolution below one ADC step. Otherwise the converted values
+    are averaged.
+
+    Returns:
+    tuple: CO, NH3 and NO2 in ppm.
+    """
+    raw = capture.read(samples)
+    with np.errstate(divide='ignore'):
+        if oversample:
+            raw = raw.mean(axis=0)
+            return float(convert_CO(raw[0])), float(convert_NH3(raw[1])), float(convert_NO2(raw[2]))
+        return float(convert_CO(raw[:, 0]).mean()), float(convert_NH3(raw[:, 1]).mean()), float(convert_NO2(raw[:, 2]).mean())
+
+def ftc_check(pathCO=adcPATH_CO, pathNH3=adcPATH_NH3, pathNO2=adcPATH_NO2):
+    """
+    Factory test: read the three channels once and check them against the limits.
+
+    Returns:
+    tuple: (passed, output_json)
+    """
+    init(pathCO, pathNH3, pathNO2)
     dataCO, dataNH3, dataNO2 = read()
 
-    if  dataCO < CO_data_upper_limit and dataCO > CO_data_lower_limit and \
-        dataNH3 < NH3_data_upper_limit and dataNH3 > NH3_data_lower_limit and \
-        dataNO2 < NO2_data_upper_limit and dataNO2 > NO2_data_lower_limit      \
-        :
+    output_json = {
+        "CO": str(dataCO),
+        "NH3": str(dataNH3),
+        "NO2": str(dataNO2)
+    }
 
+    passed = dataCO < CO_data_upper_limit and dataCO > CO_data_lower_limit and \
+             dataNH3 < NH3_data_upper_limit and dataNH3 > NH3_data_lower_limit and \
+             dataNO2 < NO2_data_upper_limit and dataNO2 > NO2_data_lower_limit
 
-        output_json = {
-            "CO": str(dataCO),
-            "NH3": str(dataNH3),
-            "NO2": str(dataNO2)
-        }
+    return passed, output_json
+
+def ftc_mode(file):
+
+    passed, output_json = ftc_check()
+
+    if passed:
 
         with open(file, 'w') as f:
             f.write(json.dumps(output_json))
@@ -94,7 +255,7 @@ def ftc_mode(file):
 def main():
 
     msg = " AMISC-6814 Sensor Python Module  "
-    help_msg = "RUN_MODE options: normal ftc, default:normal"
+    help_msg = "RUN_MODE options: normal ftc capture, default:normal"
     help_msg_output_file = "OUTPUT_FILE: specify file path to write serial number and the other data, default: /tmp/sensor_voc_out"
 
     parser = argparse.ArgumentParser(description=msg)
@@ -109,6 +270,15 @@ def main():
 
     init(adcPATH_CO, adcPATH_NH3, adcPATH_NO2)
 
+    if args.run_mode == "capture":
+        capture = AdcCapture([adcPATH_CO, adcPATH_NH3, adcPATH_NO2])
+        try:
+            dataCO, dataNH3, dataNO2 = read_capture(capture, oversample=True)
+        finally:
+            capture.stop()
+        print("CO: {} NH3: {} NO2: {}".format(dataCO, dataNH3, dataNO2))
+        return 0
+
     dataCO, dataNH3, dataNO2 = read()
 
     time.sleep(1)
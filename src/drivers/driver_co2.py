@@ -11,6 +11,13 @@ if sys.version_info[:2] == (3, 10):
 else:
     import smbus
 
+try:
+    from drivers import i2ctransfer
+    from drivers.deadline import Deadline, wait
+except ImportError: # run as a script from the drivers folder
+    import i2ctransfer
+    from deadline import Deadline, wait
+
 log_file = "/usr/local/artlite-opaq-app/data/co2_calibration_log.txt"
 #CO2_LOG_PATH = "/usr/local/artlite-opaq-app/data/co2_data.txt"
 
@@ -29,21 +36,116 @@ clb_cmd = 0x03  # Calibrate concentration value of CO2, Datasheet 2.4 Calibratio
 swv_cmd = 0x1E  # Read software version, Datasheet 2.5 Read the Serial Number of the Sensor
 sn_cmd = 0x1F   # Read the serial number of the sensor, Datasheet 2.6 Read Software Version
 
-def init(busNo):
+# Status byte bits of the measuring result, Datasheet 2.2
+STATUS_BITS = {
+    'preheating': 0,
+    'sensor_error': 1,
+    'over_range': 2,
+    'under_range': 3,
+    'non_calibrated': 4,
+    'light_aging': 5,
+    'drift': 6,
+}
+
+# Wait after the measuring command before the first result can be read
+read_cmd_delay = 0.5
+
+# Tries of read() and the wait between them
+max_retries = 3
+retry_delay = 1
+
+# Sensor checksum is not valid for current hw/sw version, so a mismatch is
+# only logged. Set to True to drop such frames once the sensors pass it.
+verify_checksum = False
+
+class CM1107Stream:
     """
-    Initialize an SMBus object with the specified bus number, get sensor ID, and return the bus.
+    Continuous reader of the CM1107 measuring result.
+
+    After the 0x01 command the sensor returns the measuring result frame
+    on every I2C read until it gets another command, so the command is
+    only sent once and each read() is a single block read. The command is
+    sent again when a frame does not start with 0x01, e.g. after the
+    sensor was power cycled or another command (serial number,
+    calibration) was sent. Checksum mismatches are logged and counted in
+    checksum_errors, the frame is only dropped if checksums are verified.
+
+    Parameters:
+    bus (smbus.SMBus): Opened bus of the sensor.
+    check_checksum (bool): Drop frames failing their checksum, verify_checksum if None.
+    """
+
+    def __init__(self, bus, check_checksum = None):
+        self.bus = bus
+        self.check_checksum = verify_checksum if check_checksum is None else check_checksum
+        self.checksum_errors = 0
+        self.streaming = False
+        self.status_byte = None
+        self.status = {}
+        self.serial_number = None
+        self.ready = Deadline()
+
+    def start(self):
+        i2ctransfer.write(self.bus, CM1107, [read_cmd])
+        self.ready = Deadline(read_cmd_delay)
+        self.streaming = True
+
+    def restart(self):
+        self.streaming = False
+
+    def read_frame(self):
+        """
+        Returns:
+        list: [0x01][DF0][DF1][DF2][CS], or None if the frame is not a valid measuring result.
+        """
+        if not self.streaming:
+            self.start()
+        self.ready.wait()
+        data = i2ctransfer.read(self.bus, CM1107, 5, read_cmd)
+        if data[0] != read_cmd:
+            print("CM1107 invalid frame: ", data)
+            self.streaming = False
+            return None
+        if calculate_checksum(data[:4]) != data[4]:
+            self.checksum_errors += 1
+            print("CM1107 checksum mismatch: ", data, "errors: ", self.checksum_errors)
+            if self.check_checksum:
+                self.streaming = False
+                return None
+        return data
+
+    def update_status(self, status_byte):
+        if status_byte != self.status_byte:
+            self.status = {name: bool(status_byte >> bit & 1) for name, bit in STATUS_BITS.items()}
+            active = [name for name, value in self.status.items() if value]
+            print("CM1107 status: ", ', '.join(active) if active else 'normal')
+        self.status_byte = status_byte
+
+    def close(self):
+        self.streaming = False
+        self.bus.close()
+
+
+def init(busNo, bus=None, check_checksum=None):
+    """
+    Initialize an SMBus object with the specified bus number, get sensor ID,
+    and return a stream reading the sensor.
 
     Parameters:
     busNo (int): The bus number to initialize the SMBus object with.
+    bus (smbus.SMBus): Already opened bus to use instead of a new SMBus object (optional).
+    check_checksum (bool): Drop frames failing their checksum, verify_checksum if None.
 
     Returns:
-    bus (smbus.SMBus): The initialized SMBus object.
+    stream (CM1107Stream): The stream of the initialized bus, pass it to read().
 
     """
-    bus = smbus.SMBus(busNo)
-    get_serial_number(bus)
+    if bus is None:
+        bus = smbus.SMBus(busNo)
+    stream = CM1107Stream(bus, check_checksum)
+    stream.serial_number = get_serial_number(bus)
     # get_software_version(bus)
-    return bus
+    return stream
 
 def log_co2_value(log_file, value):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -58,16 +160,11 @@ def log_co2_value(log_file, value):
         except:
             pass
             
-def read(bus):
+def read(stream):
     """
-    This function takes an smbus.SMBus object as its argument and uses it to 
-    communicate with the sensor. It sends the command to measure the result, 
-    waits for the sensor to finish measuring, reads the data from the sensor, 
-    extracts the CO2 measuring result and status byte from the data, 
-    calculates the checksum, and returns the CO2 measuring result and status 
-    byte as a tuple. If there is a checksum error, 
-    the function raises a ValueError.
-    
+    Read the latest CO2 measuring result from a CM1107Stream returned by
+    init(). The status bits of the frame are kept in stream.status.
+
     Datasheet:
     The master device should send command of measuring result. 
     Send: 0x01
@@ -108,105 +205,37 @@ def read(bus):
     CO2 measuring result = (0x03 0x20) hexadecimal = (800) decimal = 800 ppm
     Status bit: 0x00 means working normally
     [CS]= -(0x01+0x03+0x20+0x00)   Only keep the lowest bite.
+
+    Returns:
+    int: CO2 in ppm, -999 if there is no valid result.
     """
-    
-    """ bus.write_byte(CM1107,read_cmd) 
-    time.sleep(0.5)
-    data=bus.read_i2c_block_data(CM1107,read_cmd,4)
-    bus.close()
-
-    #print(data)
-
-    CM1107data = 256*data[2]+data[3]
-    #print(CM1107data)
-
-    return CM1107data """
-    max_retries = 3
-    attempts = 0
-    while attempts <= max_retries:
-        # Send command to measure result
-        bus.write_byte(CM1107,read_cmd)
-        
-        # Wait for the sensor to finish measuring
-        time.sleep(0.5)
-        
-        # Read data from the sensor
-        data = bus.read_i2c_block_data(CM1107, read_cmd, 5)
-        
-        bus.close()
-        # print("data: ", data)
-
-        # print("data[0]: ", data[0],
-        #       "data[1]: ", data[1],
-        #       "data[2]: ", data[2],
-        #       "data[3]: ", data[3],
-        #       "data[4]: ", data[4],)
-        
-        
-        
-        # Extract status byte from data
+    for attempt in range(max_retries):
+        if attempt:
+            wait(retry_delay)
+
+        data = stream.read_frame()
+        if data is None:
+            continue
+
         status_byte = data[3]
-        bit7 = (status_byte & 0b10000000) >> 7
-        bit6 = (status_byte & 0b01000000) >> 6
-        bit5 = (status_byte & 0b00100000) >> 5
-        bit4 = (status_byte & 0b00010000) >> 4
-        bit3 = (status_byte & 0b00001000) >> 3
-        bit2 = (status_byte & 0b00000100) >> 2
-        bit1 = (status_byte & 0b00000010) >> 1
-        bit0 = status_byte & 0b00000001
-
-        # Extract CO2 measuring result from data
-        if bit1 == 1:
+        stream.update_status(status_byte)
+
+        if stream.status['sensor_error']:
             print("Error: Sensor error detected")
-            #return -999
-        elif bit2 == 1:
+        elif stream.status['over_range']:
             print("Error: Measurement range over range")
-            #return data_upper_limit
-        elif bit3 == 1:
+        elif stream.status['under_range']:
             print("Error: Measurement range less than range")
-            #return data_lower_limit
         else:
             co2 = (data[1] << 8) + data[2]
-            # print("co2: ", co2)
             if co2 > 350 and co2 < 5000:
                 #log_co2_value(CO2_LOG_PATH,co2)
                 co2_value = max(co2, 400)
                 print("co2: ", co2_value)
                 return co2_value
 
-        # If an error is detected, increase the attempt count
-        attempts += 1
-        time.sleep(1)
-        
-        bus = init(0)
-        
     print("Error: Max retries exceeded.")
-    bus.close()
     return -999
-    # Print the status bits (optional)
-    # print("Status Byte: {}".format(status_byte))
-    # print("Bit 7: Reserved: {}".format(bit7))
-    # print("Bit 6: Drift: {}".format('Detected' if bit6 == 1 else 'Not detected'))
-    # print("Bit 5: Light Aging: {}".format('Detected' if bit5 == 1 else 'Not detected'))
-    # print("Bit 4: Calibration: {}".format('Not calibrated' if bit4 == 1 else 'Calibrated'))
-    # print("Bit 3: Measurement Range: {}".format('Less than range' if bit3 == 1 else 'Normal'))
-    # print("Bit 2: Measurement Range: {}".format('Over range' if bit2 == 1 else 'Normal'))
-    # print("Bit 1: Sensor Error: {}".format('Error' if bit1 == 1 else 'Normal'))
-    # print("Bit 0: Preheating: {}".format('In progress' if bit0 == 1 else 'Complete'))
-
-    # Sensor checksum is not valid for current hw/sw version, 
-    # checksum control would be implemented later
-    
-    # Calculate checksum
-    # cs = -(sum(data) & 0xFF)
-    
-    # Check if checksum is correct
-    # if cs != data[4]:
-    #     print("cs: ", cs)
-    #     print("data[3]: ", data[4])
-    #     raise ValueError("Checksum error")
-
-    # return co2, status_byte # status byte handling is done inside the function for now
 
 def calculate_checksum(data):
     # Calculate the sum of the data bytes
@@ -239,14 +268,14 @@ def calibrate_sensor(bus,target_ppm):
     DF1 = target_ppm & 0xFF # low byte
  
     # Send the command to the sensor
-    bus.write_i2c_block_data(CM1107, clb_cmd, [DF0, DF1])
+    i2ctransfer.write(bus, CM1107, [clb_cmd, DF0, DF1])
     print("Sent: Command={}, DF0={}, DF1={}".format(clb_cmd, DF0, DF1))
     calculated_checksum = calculate_checksum([clb_cmd, DF0, DF1])
     print("Checksum: ",calculated_checksum)
     # Wait for the sensor to respond
     time.sleep(1)
     # Read the response (should be 4 bytes)
-    response = bus.read_i2c_block_data(CM1107, clb_cmd, 4)
+    response = i2ctransfer.read(bus, CM1107, 4, clb_cmd)
  
     if len(response) == 4:
         print("Received: Command={}, DF0={}, DF1={}, CS={}".format(response[0], response[1], response[2], response[3]))
@@ -292,11 +321,8 @@ def get_serial_number(bus):
     3. The five-integer types constitute serial number of 20 digits. 
     """
 
-    # Send the command 0x1F to the sensor
-    bus.write_byte(CM1107, sn_cmd)
-
-    # Read the response data
-    data = bus.read_i2c_block_data(CM1107, sn_cmd, 32)
+    # Send the command 0x1F to the sensor and read the response data
+    data = i2ctransfer.write_read(bus, CM1107, [sn_cmd], 12)
 
     # Extract the 5 integers from the response data
     int1 = (data[1] << 8) | data[2]
@@ -323,11 +349,8 @@ def get_software_version(bus):
     [DF0] ... [DF9] is ASCII. 
     """
 
-    # Send the command 0x1F to the sensor
-    bus.write_byte(CM1107, swv_cmd)
-
-    # Read the response data
-    data = bus.read_i2c_block_data(CM1107, swv_cmd, 11)
+    # Send the command 0x1E to the sensor and read the response data
+    data = i2ctransfer.write_read(bus, CM1107, [swv_cmd], 12)
     # print("data: ", data)
 
     # convert the ASCII data to a string
@@ -336,25 +359,37 @@ def get_software_version(bus):
 
     return software_version
 
-def ftc_mode(file):
+def ftc_check(busNo=0, bus=None):
+    """
+    Factory test: read the sensor once and check the value against the limits.
+
+    Returns:
+    tuple: (passed, output_json)
+    """
+    stream = init(busNo, bus)
+    try:
+        serial_number = stream.serial_number
+        data = read(stream)
+    finally:
+        stream.close()
 
-    bus = init(0)
-    serial_number = get_serial_number(bus)
-    data = read(bus)
-    
-    
     print('''Data: %d ''' % data)
-    
+
     output_json = {
         "serial_number": str(serial_number),
         "sensor_value": str(data)
     }
 
+    return data < data_upper_limit and data > data_lower_limit, output_json
+
+def ftc_mode(file):
+
+    passed, output_json = ftc_check()
+
     with open(file, 'w') as f:
         f.write(json.dumps(output_json))
 
-    print('''Data: %d ''' % data)
-    if data < data_upper_limit and data > data_lower_limit:
+    if passed:
         print("sensor value(s) are normal, OK")
         sys.exit(0)
     else:
@@ -381,12 +416,13 @@ def main():
     elif args.run_mode == "calib":
         print("Calibration mode is active")
         print("args.target_ppm: ",args.target_ppm)
-        bus = init(0)
-        response = calibrate_sensor(bus,int(args.target_ppm))
+        stream = init(0)
+        response = calibrate_sensor(stream.bus,int(args.target_ppm))
         print("Calibration response: ",response)
+        stream.restart()
     
-    bus = init(0)
-    co2_data = read(bus)
+    stream = init(0)
+    co2_data = read(stream)
 
     return 0
 
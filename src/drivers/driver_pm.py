@@ -3,11 +3,19 @@
 import argparse
 import sys
 import json
+import struct
 
 if sys.version_info[:2] == (3, 10):
     import smbus2 as smbus
 else:
     import smbus
+
+try:
+    from drivers import i2ctransfer
+    from drivers.deadline import Deadline
+except ImportError: # run as a script from the drivers folder
+    import i2ctransfer
+    from deadline import Deadline
     
 
 
@@ -18,29 +26,140 @@ PM2008 = (0x50 >> 1)
 data_upper_limit = 300
 data_lower_limit = 0
 
-# Prepare Open single measurement command and check sum bytes
-# Datasheet 3.1 Send Command Data page:17
+# Command frame, Datasheet 3.1 Send Command Data page:17
 # Send by main controlled board:
 # START+WRITE+ACK+P1+ACK+P2+ACK... +P7+ACK+STOP
 p1=0x16 # Frame header
 p2=7    # Number of byte, not including length of device address (From P1 to P7, 7 bytes in total)
-p3=2    # Data 1
-p4=0xFF # Data 2, high byte
-p5=0xFF # Data 2, low byte
-p6=0xFF # Data 3
-p7=p1^p2^p3^p4^p5^p6    # Data check code
+# P3 Data 1: control, P4/P5 Data 2: measuring period of the timing mode, P6 Data 3, P7 Data check code
 
-def delay_sec(count):
-    while(count>1):
-        count=count-1
+# Control values of P3
+CLOSE_MEASUREMENT = 1
+SINGLE_MODE = 2
+CONTINUOUS_MODE = 3
+TIMING_MODE = 4
+DYNAMIC_MODE = 5
+
+# Measuring modes as reported in P4/P5 of the data frame, timing mode reports its period
+MIN_TIMING_PERIOD = 60
+
+# Sensor status P3 of the data frame with valid concentrations
+STATUS_MEASURING = 2
+STATUS_DATA_STABLE = 0x80
+
+# Data frame: header, frame length, status, mode, calibration coefficient,
+# 12 channels, check code
+FRAME_FORMAT = '>BBBHH12HB'
+FRAME_LENGTH = 32
+
+CHANNEL_KEYS = (
+    "CAIRPM2008_1.0_GRIMM_LEVEL",
+    "CAIRPM2008_2.5_GRIMM_LEVEL",
+    "CAIRPM2008_10_GRIMM_LEVEL",
+    "CAIRPM2008_1.0_TSI_LEVEL",
+    "CAIRPM2008_2.5_TSI_LEVEL",
+    "CAIRPM2008_10_TSI_LEVEL",
+    "CAIRPM2008_0.3_L_LEVEL",
+    "CAIRPM2008_0.5_L_LEVEL",
+    "CAIRPM2008_1.0_L_LEVEL",
+    "CAIRPM2008_2.5_L_LEVEL",
+    "CAIRPM2008_5_L_LEVEL",
+    "CAIRPM2008_10_L_LEVEL",
+)
+
+# Wait after a command before the sensor answers with the new mode
+mode_cmd_delay = 0.1
+
+def xor_check(data):
+    check = 0
+    for byte in data:
+        check ^= byte
+    return check
+
+class PM2008Stream:
+    """
+    PM2008 configured for one measuring mode.
+
+    The mode command is sent once; the sensor then keeps measuring and
+    every read() is a single 32 byte read of the latest data frame. The
+    command is sent again if the frame shows the measurement closed, e.g.
+    after a power cycle.
+
+    Parameters:
+    bus (smbus.SMBus): Opened bus of the sensor.
+    mode (int): SINGLE_MODE, CONTINUOUS_MODE, DYNAMIC_MODE, or the
+    measuring period in seconds (>= 60) for the timing mode.
+    """
+
+    def __init__(self, bus, mode = CONTINUOUS_MODE):
+        if mode not in (SINGLE_MODE, CONTINUOUS_MODE, DYNAMIC_MODE) and mode < MIN_TIMING_PERIOD:
+            raise ValueError("Invalid PM2008 measuring mode: {}".format(mode))
+        self.bus = bus
+        self.mode = mode
+        self.configured = False
+        self.ready = Deadline()
+
+    def command(self):
+        if self.mode >= MIN_TIMING_PERIOD:
+            control, period = TIMING_MODE, self.mode
+        else:
+            control, period = self.mode, 0xFFFF
+        frame = [p1, p2, control, (period >> 8) & 0xFF, period & 0xFF, 0xFF]
+        return frame + [xor_check(frame)]
+
+    def configure(self):
+        frame = self.command()
+        i2ctransfer.write(self.bus, PM2008, frame)
+        self.ready = Deadline(mode_cmd_delay)
+        # The single mode measures once per command
+        self.configured = self.mode != SINGLE_MODE
+
+    def read_frame(self):
+        """
+        Returns:
+        tuple: The unpacked FRAME_FORMAT fields, or None if the frame is invalid.
+        """
+        if not self.configured:
+            self.configure()
+        self.ready.wait()
+        # The register byte is only sent by python-smbus, the sensor ignores it
+        data = i2ctransfer.read(self.bus, PM2008, FRAME_LENGTH, 0x00)
+        if data[0] != p1 or data[1] != FRAME_LENGTH or xor_check(data[:-1]) != data[-1]:
+            print("PM2008 invalid frame: ", data)
+            return None
+        frame = struct.unpack(FRAME_FORMAT, bytes(data))
+        if frame[2] == CLOSE_MEASUREMENT:
+            self.configured = False
+        return frame
+
+    def stop(self):
+        """
+        Close the measurement, which stops the fan. The next read sends
+        the mode command again.
+        """
+        frame = [p1, p2, CLOSE_MEASUREMENT, 0xFF, 0xFF, 0xFF]
+        i2ctransfer.write(self.bus, PM2008, frame + [xor_check(frame)])
+        self.configured = False
+
+    def close(self):
+        self.bus.close()
 
-def init(busNo):
-    
-    bus = smbus.SMBus(busNo)
-    return bus
 
-def read(bus):
+def init(busNo, bus=None, mode=CONTINUOUS_MODE):
     """
+    Returns:
+    stream (PM2008Stream): Stream of the sensor in the given measuring mode, pass it to read().
+    """
+    if bus is None:
+        bus = smbus.SMBus(busNo)
+    stream = PM2008Stream(bus, mode)
+    stream.configure()
+    return stream
+
+def read(stream):
+    """
+    Read the latest data frame of a PM2008Stream returned by init().
+
     Datasheet 3.2 Read Data Command
     Send by main controlled board:
     START+READ+ACK+P1+ACK+P2+ACK+....+P32+NACK+STOP
@@ -79,67 +198,33 @@ def read(bus):
     P30	Data 14, high byte	Number of PM10, unit: pcs/0.1L
     P31	Data 14, low byte	P32	Data check code Check code = (P1^P2^...^P31)
     """  
-    #send measure command, page:17
-    bus.write_i2c_block_data(PM2008,p1,[p2,p3,p4,p5,p6,p7])
-    delay_sec(0xFFFF)
-    #read sensor values, page:18
-    data=bus.read_i2c_block_data(PM2008,0x00,32)
-    bus.close()
-    #print(data)
-    #print("PM2008 Status Byte: ",data[2])
-    #print("PM1.0 GRIMM:",256*data[7]+data[8])
-    #print("PM2.5 GRIMM:",256*data[9]+data[10])
-    #print("PM 10 GRIMM:",256*data[11]+data[12])
-    #print("PM1.0 TSI  :",256*data[13]+data[14])
-    #print("PM2.5 TSI  :",256*data[15]+data[16])
-    #print("PM 10 TSI  :",256*data[17]+data[18])
-    #print("PM0.3 L    :",256*data[19]+data[20])
-    #print("PM0.5 L    :",256*data[21]+data[22])
-    #print("PM1.0 L    :",256*data[23]+data[24])
-    #print("PM2.5 L    :",256*data[25]+data[26])
-    #print("PM  5 L    :",256*data[27]+data[28])
-    #print("PM 10 L    :",256*data[29]+data[30])
-    #print()
-
-    # Check status byte and return -999 if not measuring
-    if data[2] != 2:
-        pm2008SensorVals = {
-            "CAIRPM2008_1.0_GRIMM_LEVEL": -999,
-            "CAIRPM2008_2.5_GRIMM_LEVEL": -999,
-            "CAIRPM2008_10_GRIMM_LEVEL": -999,
-            "CAIRPM2008_1.0_TSI_LEVEL": -999,
-            "CAIRPM2008_2.5_TSI_LEVEL": -999,
-            "CAIRPM2008_10_TSI_LEVEL": -999,
-            "CAIRPM2008_0.3_L_LEVEL": -999,
-            "CAIRPM2008_0.5_L_LEVEL": -999,
-            "CAIRPM2008_1.0_L_LEVEL": -999,
-            "CAIRPM2008_2.5_L_LEVEL": -999,
-            "CAIRPM2008_5_L_LEVEL": -999,
-            "CAIRPM2008_10_L_LEVEL": -999
-        }
-    else:
-        pm2008SensorVals = {}
-        pm2008SensorVals["CAIRPM2008_1.0_GRIMM_LEVEL"] = 256*data[7]+data[8]
-        pm2008SensorVals["CAIRPM2008_2.5_GRIMM_LEVEL"] = 256*data[9]+data[10]
-        pm2008SensorVals["CAIRPM2008_10_GRIMM_LEVEL"] = 256*data[11]+data[12]
-        pm2008SensorVals["CAIRPM2008_1.0_TSI_LEVEL"] = 256*data[13]+data[14]
-        pm2008SensorVals["CAIRPM2008_2.5_TSI_LEVEL"] = 256*data[15]+data[16]
-        pm2008SensorVals["CAIRPM2008_10_TSI_LEVEL"] = 256*data[17]+data[18]
-        pm2008SensorVals["CAIRPM2008_0.3_L_LEVEL"] = 256*data[19]+data[20]
-        pm2008SensorVals["CAIRPM2008_0.5_L_LEVEL"] = 256*data[21]+data[22]
-        pm2008SensorVals["CAIRPM2008_1.0_L_LEVEL"] = 256*data[23]+data[24]
-        pm2008SensorVals["CAIRPM2008_2.5_L_LEVEL"] = 256*data[25]+data[26]
-        pm2008SensorVals["CAIRPM2008_5_L_LEVEL"] = 256*data[27]+data[28]
-        pm2008SensorVals["CAIRPM2008_10_L_LEVEL"] = 256*data[29]+data[30]
+    frame = stream.read_frame()
+
+    # Return -999 if the frame is invalid or the sensor is not measuring
+    if frame is None or frame[2] not in (STATUS_MEASURING, STATUS_DATA_STABLE):
+        return dict.fromkeys(CHANNEL_KEYS, -999)
 
     #return PM values
-    return pm2008SensorVals
+    return dict(zip(CHANNEL_KEYS, frame[5:17]))
 
-def ftc_mode(file):
+def stop(stream):
+    """
+    Stop the fan of a PM2008Stream returned by init() until the next read().
+    """
+    stream.stop()
 
-    bus = init(0)
-    data = read(bus)
-    res = 0
+def ftc_check(busNo=0, bus=None):
+    """
+    Factory test: read one data frame and check the PM values against the limits.
+
+    Returns:
+    tuple: (passed, output_json)
+    """
+    stream = init(busNo, bus)
+    try:
+        data = read(stream)
+    finally:
+        stream.close()
     print('''1.0_TSI_LEVEL: %d ''' % data["CAIRPM2008_1.0_TSI_LEVEL"])
     print('''2.5_TSI_LEVEL: %d ''' % data["CAIRPM2008_2.5_TSI_LEVEL"])
     print('''10_TSI_LEVEL: %d ''' % data["CAIRPM2008_10_TSI_LEVEL"])
@@ -151,14 +236,20 @@ def ftc_mode(file):
         "CAIRPM2008_10_TSI_LEVEL": str(data["CAIRPM2008_10_TSI_LEVEL"])
     }
 
+    passed = data["CAIRPM2008_1.0_TSI_LEVEL"] < data_upper_limit and data["CAIRPM2008_1.0_TSI_LEVEL"] > data_lower_limit and \
+             data["CAIRPM2008_2.5_TSI_LEVEL"] < data_upper_limit and data["CAIRPM2008_2.5_TSI_LEVEL"] > data_lower_limit and \
+             data["CAIRPM2008_10_TSI_LEVEL"] < data_upper_limit and data["CAIRPM2008_10_TSI_LEVEL"] > data_lower_limit
+
+    return passed, output_json
+
+def ftc_mode(file):
+
+    passed, output_json = ftc_check()
+
     with open(file, 'w') as f:
         f.write(json.dumps(output_json))
 
-
-    if  data["CAIRPM2008_1.0_TSI_LEVEL"] < data_upper_limit and data["CAIRPM2008_1.0_TSI_LEVEL"] > data_lower_limit and \
-        data["CAIRPM2008_2.5_TSI_LEVEL"] < data_upper_limit and data["CAIRPM2008_1.0_TSI_LEVEL"] > data_lower_limit and \
-        data["CAIRPM2008_10_TSI_LEVEL"] < data_upper_limit and data["CAIRPM2008_1.0_TSI_LEVEL"] > data_lower_limit      \
-        :
+    if passed:
         print("sensor value(s) are normal, OK")
         sys.exit(0)
     else:
@@ -181,8 +272,8 @@ def main():
     if args.run_mode == "ftc":
         ftc_mode(args.output_file)
 
-    bus = init(0)
-    pm2008_data = read(bus)
+    stream = init(0)
+    pm2008_data = read(stream)
     
     
     return 0
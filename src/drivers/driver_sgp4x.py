@@ -3,17 +3,17 @@ import os, csv
 import argparse
 import json
 import sys
+import threading
 from sensirion_i2c_driver import LinuxI2cTransceiver, I2cConnection
 from sensirion_i2c_sgp4x import Sgp40I2cDevice
 from sensirion_i2c_sgp4x import Sgp41I2cDevice
-from subprocess import check_output
 
-
-
-if sys.version_info[:3] == (2,7,14) or sys.version_info[:3] == (3,5,3):
-    py3x_version = str(5)
-else:
-    py3x_version = str(10) 
+try:
+    from drivers.sgpidx import GasIndexEngine, HISTORY_RECORD_FORMAT
+    from drivers.ringbuffer import read_records
+except ImportError: # run as a script from the drivers folder
+    from sgpidx import GasIndexEngine, HISTORY_RECORD_FORMAT
+    from ringbuffer import read_records
 
 
 # Sensor limits
@@ -30,16 +30,57 @@ SGP4x_ADDR_BUS_NO = 0
 
 vocBufferSize = 5000
 vocBufferFolder = "/home/cairapp/VOC/"
-vocBufferFile = vocBufferFolder + "vochistory.csv" 
+vocBufferFile = vocBufferFolder + "vochistory.bin"
+vocLegacyBufferFile = vocBufferFolder + "vochistory.csv"
+vocSnapshotFile = vocBufferFolder + "vocstate.bin"
 
 noxBufferSize = 5000
 noxBufferFolder = "/home/cairapp/NOX/"
-noxBufferFile = noxBufferFolder + "noxhistory.csv" 
-
-
-def init(busNO, sensorName, sensorModel, conditioning=False):
-    busNo_addr = '/dev/i2c-'+str(busNO)
-    i2c_transceiver_sgp = LinuxI2cTransceiver(busNo_addr)
+noxBufferFile = noxBufferFolder + "noxhistory.bin"
+noxLegacyBufferFile = noxBufferFolder + "noxhistory.csv"
+
+# Gas index engines, created on first use and kept for the lifetime of the process.
+# Reads run on worker threads, the lock makes sure each engine is created once.
+gas_index_engines = {}
+gas_index_engines_lock = threading.Lock()
+
+def get_gas_index(measurement_type, sraw):
+    engine = gas_index_engines.get(measurement_type)
+    if engine is None:
+        with gas_index_engines_lock:
+            engine = gas_index_engines.get(measurement_type)
+            if engine is None:
+                if measurement_type == "VOC":
+                    engine = GasIndexEngine("VOC", vocBufferSize, vocBufferFolder, vocBufferFile, vocSnapshotFile, vocLegacyBufferFile)
+                else:
+                    engine = GasIndexEngine("NOX", noxBufferSize, noxBufferFolder, noxBufferFile, legacyBufferFile=noxLegacyBufferFile)
+                gas_index_engines[measurement_type] = engine
+    return engine.process(int(str(sraw)))
+
+def dump_history(file):
+    """
+    Write the buffered raw VOC and NOX samples to a CSV file for diagnostics.
+    """
+    with open(file, 'w') as f:
+        f.write("signal,timestamp,raw\n")
+        for measurement_type, bufferFile in (("VOC", vocBufferFile), ("NOX", noxBufferFile)):
+            if not os.path.isfile(bufferFile):
+                continue
+            try:
+                records = read_records(bufferFile, HISTORY_RECORD_FORMAT)
+            except ValueError as e:
+                print("Skipping {} history: {}".format(measurement_type, e))
+                continue
+            for timestamp, raw in records:
+                f.write("{},{},{}\n".format(measurement_type, timestamp, raw))
+
+
+def init(busNO, sensorName, sensorModel, conditioning=False, i2cTransceiver=None):
+    if i2cTransceiver is None:
+        busNo_addr = '/dev/i2c-'+str(busNO)
+        i2c_transceiver_sgp = LinuxI2cTransceiver(busNo_addr)
+    else:
+        i2c_transceiver_sgp = i2cTransceiver
     try:
         if sensorModel == "SGP40":
             sgp4x = Sgp40I2cDevice(I2cConnection(i2c_transceiver_sgp), slave_address=SGP4x_ADDR)
@@ -71,39 +112,41 @@ def read(sensor, i2cTransceiver, sensorModel, temperature = 25.0, humidity = 50.
     if sensorModel == "SGP40":
         sraw_voc = sensor.measure_raw(temperature, humidity)
 
-
-        cmd = "python3." + py3x_version + " /usr/local/artlite-opaq-app/src/drivers/sgpidx_p3.py " + "VOC" + " " + str(sraw_voc) + " " + str(vocBufferSize) + " " + vocBufferFolder + " " + vocBufferFile
-        VOCindex = check_output(cmd, shell=True)
-        voc_data = int(VOCindex)
+        voc_data = get_gas_index("VOC", sraw_voc)
         nox_data = -999
-        
-        i2cTransceiver.close()
     
     elif sensorModel == "SGP41":
         sraw_voc, sraw_nox = sensor.measure_raw(temperature, humidity)
 
-
-        cmd = "python3." + py3x_version + " /usr/local/artlite-opaq-app/src/drivers/sgpidx_p3.py " + "VOC" + " " + str(sraw_voc) + " " + str(vocBufferSize) + " " + vocBufferFolder + " " + vocBufferFile
-        VOCindex = check_output(cmd, shell=True)
-        
-        cmd = "python3." + py3x_version + " /usr/local/artlite-opaq-app/src/drivers/sgpidx_p3.py " + "NOX" + " " + str(sraw_nox) + " " + str(noxBufferSize) + " " + noxBufferFolder + " " + noxBufferFile
-        NOXindex = check_output(cmd, shell=True)
-
-        voc_data = int(VOCindex)
-        nox_data = int(NOXindex)
+        voc_data = get_gas_index("VOC", sraw_voc)
+        nox_data = get_gas_index("NOX", sraw_nox)
         raw_voc = int(str(sraw_voc))
         raw_nox = int(str(sraw_nox))
-        
-        i2cTransceiver.close()
     
     return voc_data, nox_data, raw_voc, raw_nox
+
+def stop(sensor):
+    """
+    Turn the hotplate off, the sensor stays idle until the next read().
+    """
+    sensor.turn_heater_off()
     
-def ftc_mode(file, sensor_model="SGP41"):
-    bus, i2c_transceiver_sgp = init(SGP4x_ADDR_BUS_NO, "SGP4x", sensor_model, conditioning=True)
-    serial_number = bus.get_serial_number()
-    
-   
-    data_VOC, data_NOX, data_raw_VOC, data_raw_NOX = read(bus, i2c_transceiver_sgp, sensor_model)
+def ftc_check(sensor_model="SGP41", busNo=SGP4x_ADDR_BUS_NO, i2cTransceiver=None):
+    """
+    Factory test: condition the sensor, measure once and check the VOC and
+    NOX values against the limits.
+
+    Returns:
+    tuple: (passed, output_json)
+    """
+    bus, i2c_transceiver_sgp = init(busNo, "SGP4x", sensor_model, conditioning=True, i2cTransceiver=i2cTransceiver)
+    if bus == -1:
+        raise IOError("SGP4x not found at 0x{:02X}".format(SGP4x_ADDR))
+    try:
+        serial_number = bus.get_serial_number()
+        data_VOC, data_NOX, data_raw_VOC, data_raw_NOX = read(bus, i2c_transceiver_sgp, sensor_model)
+    finally:
+        i2c_transceiver_sgp.close()
 
     print('''Data raw TVOC: %d ''' % data_raw_VOC)
     print('''Data TVOC: %d ''' % data_VOC)
@@ -118,14 +161,22 @@ def ftc_mode(file, sensor_model="SGP41"):
         "NO2": str(data_NOX)
     }
 
-        
+
+    passed = data_VOC <= data_upper_limit and data_VOC >= data_lower_limit and \
+             data_NOX <= data_upper_limit and data_NOX >= data_lower_limit and \
+             data_raw_VOC <= data_raw_upper_limit and data_raw_VOC >= data_raw_lower_limit and \
+             data_raw_NOX <= data_raw_upper_limit and data_raw_NOX >= data_raw_lower_limit
+
+    return passed, output_json
+
+def ftc_mode(file, sensor_model="SGP41"):
+
+    passed, output_json = ftc_check(sensor_model)
+
     with open(file, 'w') as f:
-        f.write(json.dumps(output_json))  
-    
-    if data_VOC <= data_upper_limit and data_VOC >= data_lower_limit  and \
-        data_NOX <= data_upper_limit and data_NOX >= data_lower_limit and \
-        data_raw_VOC <= data_raw_upper_limit and data_raw_VOC >= data_raw_lower_limit and \
-        data_raw_NOX<= data_raw_upper_limit and data_raw_NOX >= data_raw_lower_limit:
+        f.write(json.dumps(output_json))
+
+    if passed:
         print("sensor value(s) are normal, OK")
         sys.exit(0)
     else:
@@ -136,7 +187,7 @@ def main():
 
     # FTC
     msg = "VOC Sensor Python Module"
-    help_msg = "RUN_MODE options: normal ftc, default:normal"
+    help_msg = "RUN_MODE options: normal ftc history, default:normal"
     help_msg_output_file = "OUTPUT_FILE: specify file path to write serial number and the other data, default: /tmp/sensor_voc_out"
 
     parser = argparse.ArgumentParser(description=msg)
@@ -148,6 +199,9 @@ def main():
 
     if args.run_mode == "ftc":
         ftc_mode(args.output_file)
+    elif args.run_mode == "history":
+        dump_history(args.output_file)
+        return 0
 
     # Sensor init and read
     try:
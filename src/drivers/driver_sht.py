@@ -21,9 +21,12 @@ HUM_DATA_LOWER_LIMIT = 0
 
 
     
-def init(busNo, sensorName, addr=Z7N904R_SHT30_ADDR): 
-    busNo_addr = '/dev/i2c-'+ str(busNo)
-    i2c_transceiver_sht = LinuxI2cTransceiver(busNo_addr)
+def init(busNo, sensorName, addr=Z7N904R_SHT30_ADDR, i2cTransceiver=None): 
+    if i2cTransceiver is None:
+        busNo_addr = '/dev/i2c-'+ str(busNo)
+        i2c_transceiver_sht = LinuxI2cTransceiver(busNo_addr)
+    else:
+        i2c_transceiver_sht = i2cTransceiver
     try:
         if addr == SHT40_BD1B_ADDR:
             sht = Sht4xI2cDevice(I2cConnection(i2c_transceiver_sht), slave_address=addr)
@@ -46,17 +49,27 @@ def read(sensor, i2cTransceiver):
     sht_data = {}
     temp = temperature.degrees_celsius
     hum = humidity.percent_rh
-    i2cTransceiver.close()
     return temp, hum
 
-def ftc_mode(sensor_type="internal", file="/tmp/sensor_rht_out"):
+def ftc_check(sensor_type="internal", busNo=SHT_BUS_NO, i2cTransceiver=None):
+    """
+    Factory test: measure once and check temperature and humidity against the limits.
+
+    Returns:
+    tuple: (passed, output_json)
+    """
     if sensor_type == "internal":
         addr = SHT40_BD1B_ADDR
     else:
         addr = Z7N904R_SHT30_ADDR
 
-    bus, i2c_transceiver_sht = init(SHT_BUS_NO, "SHT", addr)
-    temp, hum = read(bus, i2c_transceiver_sht)
+    bus, i2c_transceiver_sht = init(busNo, "SHT", addr, i2cTransceiver)
+    if bus == -1:
+        raise IOError("SHT not found at 0x{:02X}".format(addr))
+    try:
+        temp, hum = read(bus, i2c_transceiver_sht)
+    finally:
+        i2c_transceiver_sht.close()
     print('''Temperature: %d ''' % temp)
     print('''Rel. Humidity: %d ''' % hum)
 
@@ -66,13 +79,19 @@ def ftc_mode(sensor_type="internal", file="/tmp/sensor_rht_out"):
         "sensor_hum": str(hum)
     }
 
+    passed = temp < TEMP_DATA_UPPER_LIMIT and temp > TEMP_DATA_LOWER_LIMIT and \
+             hum < HUM_DATA_UPPER_LIMIT and hum > HUM_DATA_LOWER_LIMIT
+
+    return passed, output_json
+
+def ftc_mode(sensor_type="internal", file="/tmp/sensor_rht_out"):
+
+    passed, output_json = ftc_check(sensor_type)
+
     with open(file, 'w') as f:
         f.write(json.dumps(output_json))
 
-
-    if  temp < TEMP_DATA_UPPER_LIMIT and temp > TEMP_DATA_LOWER_LIMIT and   \
-        hum < HUM_DATA_UPPER_LIMIT and hum > HUM_DATA_LOWER_LIMIT           \
-        :
+    if passed:
         print("sensor value(s) are normal, OK")
         sys.exit(0)
     else:
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+
+if sys.version_info[:2] == (3, 10):
+    import smbus2 as smbus
+else:
+    import smbus
+
+# smbus2 only, python-smbus has no i2c_rdwr
+i2c_msg = getattr(smbus, 'i2c_msg', None)
+
+
+class TransactionCounter:
+    """
+    Number of I2C transactions (one ioctl each) and bytes moved by this module.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.transactions = 0
+        self.bytes = 0
+
+    def add(self, length):
+        with self.lock:
+            self.transactions += 1
+            self.bytes += length
+
+    def snapshot(self):
+        with self.lock:
+            return {'transactions': self.transactions, 'bytes': self.bytes}
+
+    def reset(self):
+        with self.lock:
+            self.transactions = 0
+            self.bytes = 0
+
+counter = TransactionCounter()
+
+
+def combined(bus):
+    return i2c_msg is not None and hasattr(bus, 'i2c_rdwr')
+
+
+def write_read(bus, addr, data, length):
+    """
+    Write data and read length bytes in one combined transaction (repeated
+    start, no stop in between). Without i2c_rdwr this is an SMBus block
+    read with data[0] as register, which is the same on the wire for a
+    single byte write.
+
+    Returns:
+    list: The bytes read.
+    """
+    counter.add(len(data) + length)
+    if combined(bus):
+        write = i2c_msg.write(addr, data)
+        read = i2c_msg.read(addr, length)
+        bus.i2c_rdwr(write, read)
+        return list(read)
+    if len(data) != 1:
+        raise ValueError("python-smbus can only write a register byte before a read")
+    if length == 1:
+        return [bus.read_byte_data(addr, data[0])]
+    return bus.read_i2c_block_data(addr, data[0], length)
+
+
+def write(bus, addr, data):
+    """
+    Write data in one transaction.
+    """
+    counter.add(len(data))
+    if combined(bus):
+        bus.i2c_rdwr(i2c_msg.write(addr, data))
+    elif len(data) == 1:
+        bus.write_byte(addr, data[0])
+    elif len(data) == 2:
+        bus.write_byte_data(addr, data[0], data[1])
+    else:
+        bus.write_i2c_block_data(addr, data[0], list(data[1:]))
+
+
+def read(bus, addr, length, register):
+    """
+    Read length bytes without writing first. python-smbus cannot do a
+    plain read, there the read is an SMBus block read that writes register
+    first, so register must be harmless to resend to the device.
+
+    Returns:
+    list: The bytes read.
+    """
+    counter.add(length)
+    if combined(bus):
+        msg = i2c_msg.read(addr, length)
+        bus.i2c_rdwr(msg)
+        return list(msg)
+    return bus.read_i2c_block_data(addr, register, length)
+
+
+# Longest SMBus block read of python-smbus
+SMBUS_BLOCK_MAX = 32
+
+
+def read_registers(bus, addr, register, length):
+    """
+    Read length consecutive registers starting at register, for devices
+    that auto-increment the register address. Without i2c_rdwr reads
+    longer than an SMBus block are split into several blocks.
+
+    Returns:
+    list: The register values.
+    """
+    if combined(bus) or length <= SMBUS_BLOCK_MAX:
+        return write_read(bus, addr, [register], length)
+    values = []
+    for offset in range(0, length, SMBUS_BLOCK_MAX):
+        values += write_read(bus, addr, [register + offset], min(SMBUS_BLOCK_MAX, length - offset))
+    return values
+
+def read_register(bus, addr, register):
+    return write_read(bus, addr, [register], 1)[0]
+
+def write_register(bus, addr, register, value):
+    write(bus, addr, [register, value])
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import os
+import mmap
+import struct
+import threading
+
+# File header: magic, format version, record size, capacity, head (next slot to write), count
+HEADER_MAGIC = b'RING'
+HEADER_VERSION = 1
+HEADER_FORMAT = '<4sBxHIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+class RingBuffer:
+    """
+    Memory-mapped ring buffer of fixed-size binary records.
+
+    The file holds a small header followed by capacity records. An append
+    writes one record and updates the head index in place, so it is O(1)
+    and only touches one or two pages of the file. When the buffer is full
+    the oldest record is overwritten. The kernel writes dirty pages back
+    in the background; call flush() to force it.
+
+    A file whose layout does not match record_format and capacity is
+    reinitialised empty.
+
+    Parameters:
+    path (str): Path of the ring file.
+    record_format (str): struct format of one record, e.g. '<IH'.
+    capacity (int): Number of records kept.
+    """
+
+    def __init__(self, path, record_format, capacity):
+        self.path = path
+        self.record = struct.Struct(record_format)
+        self.capacity = capacity
+        self.lock = threading.Lock()
+
+        size = HEADER_SIZE + self.record.size * capacity
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        if not fresh:
+            magic, version, record_size, file_capacity, head, count = struct.unpack_from(HEADER_FORMAT, self.map, 0)
+            fresh = magic != HEADER_MAGIC or version != HEADER_VERSION or record_size != self.record.size \
+                or file_capacity != capacity or head >= capacity or count > capacity
+
+        if fresh:
+            self.head = 0
+            self.count = 0
+            self.write_header()
+        else:
+            self.head = head
+            self.count = count
+
+    def write_header(self):
+        struct.pack_into(HEADER_FORMAT, self.map, 0, HEADER_MAGIC, HEADER_VERSION,
+                         self.record.size, self.capacity, self.head, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, *values):
+        with self.lock:
+            self.record.pack_into(self.map, HEADER_SIZE + self.head * self.record.size, *values)
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.write_header()
+
+    def read_all(self):
+        """
+        Returns:
+        list: All records as tuples, oldest first.
+        """
+        with self.lock:
+            start = (self.head - self.count) % self.capacity
+            view = memoryview(self.map)[HEADER_SIZE:]
+            size = self.record.size
+            if start + self.count <= self.capacity:
+                data = bytes(view[start * size:(start + self.count) * size])
+            else:
+                data = bytes(view[start * size:]) + bytes(view[:self.head * size])
+            view.release()
+        return list(self.record.iter_unpack(data))
+
+    def clear(self):
+        with self.lock:
+            self.head = 0
+            self.count = 0
+            self.write_header()
+
+    def flush(self):
+        with self.lock:
+            self.map.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.map.closed:
+                self.map.flush()
+                self.map.close()
+
+
+def read_records(path, record_format):
+    """
+    Read all records of a ring file without changing it. Unlike
+    RingBuffer, the capacity is taken from the file's header and a file
+    of another layout is never reinitialised.
+
+    Parameters:
+    path (str): Path of the ring file.
+    record_format (str): struct format of one record.
+
+    Returns:
+    list: All records as tuples, oldest first.
+
+    Raises:
+    ValueError: The file is not a ring file of record_format records.
+    """
+    record = struct.Struct(record_format)
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        raise ValueError('{} is not a ring file'.format(path))
+    magic, version, record_size, capacity, head, count = struct.unpack_from(HEADER_FORMAT, data, 0)
+    if magic != HEADER_MAGIC or version != HEADER_VERSION or record_size != record.size or capacity == 0 \
+            or head >= capacity or count > capacity or len(data) != HEADER_SIZE + record_size * capacity:
+        raise ValueError('{} is not a ring file of {} records'.format(path, record_format))
+    start = (head - count) % capacity
+    return [record.unpack_from(data, HEADER_SIZE + ((start + i) % capacity) * record_size) for i in range(count)]
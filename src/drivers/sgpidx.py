@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import zlib
+import struct
+import threading
+from sensirion_gas_index_algorithm.voc_algorithm import VocAlgorithm
+from sensirion_gas_index_algorithm.nox_algorithm import NoxAlgorithm
+
+try:
+    from drivers.ringbuffer import RingBuffer
+except ImportError: # run as a script from the drivers folder
+    from ringbuffer import RingBuffer
+
+# History record: unix time of the sample, raw SGP4x ticks
+HISTORY_RECORD_FORMAT = '<IH'
+
+# Snapshot file layout: magic, format version, measurement type, state0,
+# state1, wall clock time of the snapshot, followed by a CRC32 of these fields
+SNAPSHOT_MAGIC = b'GIDX'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FORMAT = '<4sBBiid'
+SNAPSHOT_TYPES = {"VOC": 0, "NOX": 1}
+
+# Sensirion: states can only be retrieved after 3 hours of continuous
+# operation and should not be restored after interruptions of more than 10 minutes
+SNAPSHOT_MIN_LEARNING_TIME = 3 * 60 * 60
+SNAPSHOT_MAX_AGE = 10 * 60
+SNAPSHOT_INTERVAL = 2 * 60
+
+
+class GasIndexEngine:
+    """
+    Resident Sensirion gas index algorithm for one signal (VOC or NOX).
+
+    The algorithm instance lives as long as the application, so each raw
+    SGP4x sample is processed in O(1). The raw samples are also appended
+    to a memory-mapped ring buffer file holding the last bufferSize
+    samples; it is replayed only once, when the engine is created, and
+    only if no recent state snapshot is available.
+
+    Once the VOC algorithm has learned, its state is saved to a small
+    binary snapshot file every SNAPSHOT_INTERVAL seconds. After a restart
+    the state is restored from that file, so the index is valid from the
+    first sample without replaying the history. Sensirion documents
+    get_states()/set_states() for the VOC algorithm only, the NOX engine
+    always rebuilds its state from the history.
+
+    Parameters:
+    measurement_type (str): "VOC" or "NOX".
+    bufferSize (int): Number of raw samples kept in the history file.
+    bufferFolder (str): Folder of the history file.
+    bufferFile (str): Path of the history ring buffer file.
+    snapshotFile (str): Path of the state snapshot file (optional, VOC only).
+    legacyBufferFile (str): CSV history of older versions, imported into
+    the ring buffer once and then removed (optional).
+    """
+
+    def __init__(self, measurement_type, bufferSize, bufferFolder, bufferFile, snapshotFile = None, legacyBufferFile = None):
+        self.measurement_type = measurement_type
+        self.bufferSize = bufferSize
+        self.bufferFolder = bufferFolder
+        self.bufferFile = bufferFile
+        self.snapshotFile = snapshotFile
+        self.lock = threading.Lock()
+
+        if measurement_type == "VOC":
+            self.algorithm = VocAlgorithm()
+        elif measurement_type == "NOX":
+            if snapshotFile is not None:
+                raise ValueError("State snapshots are only supported for VOC")
+            self.algorithm = NoxAlgorithm()
+        else:
+            raise ValueError("Unknown measurement type: {}".format(measurement_type))
+
+        self.learningStart = time.monotonic()
+        self.lastSnapshot = time.monotonic()
+
+        if not os.path.exists(self.bufferFolder):
+            os.makedirs(self.bufferFolder)
+
+        self.history = RingBuffer(self.bufferFile, HISTORY_RECORD_FORMAT, self.bufferSize)
+        if legacyBufferFile is not None and os.path.isfile(legacyBufferFile):
+            self.import_legacy_history(legacyBufferFile)
+
+        if self.load_snapshot():
+            # The restored state has already been learned
+            self.learningStart -= SNAPSHOT_MIN_LEARNING_TIME
+        else:
+            self.replay_history()
+
+    def get_states(self):
+        return self.algorithm.get_states()
+
+    def set_states(self, state0, state1):
+        self.algorithm.set_states(state0, state1)
+
+    def load_snapshot(self):
+        """
+        Restore the algorithm state from the snapshot file.
+
+        Returns:
+        bool: True if a valid snapshot younger than SNAPSHOT_MAX_AGE was restored.
+        """
+        if self.snapshotFile is None or not os.path.isfile(self.snapshotFile):
+            return False
+
+        try:
+            with open(self.snapshotFile, 'rb') as f:
+                data = f.read()
+            size = struct.calcsize(SNAPSHOT_FORMAT)
+            if len(data) != size + 4:
+                raise ValueError("invalid size")
+            if struct.unpack('<I', data[size:])[0] != zlib.crc32(data[:size]):
+                raise ValueError("checksum error")
+            magic, version, snapshot_type, state0, state1, timestamp = struct.unpack(SNAPSHOT_FORMAT, data[:size])
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or snapshot_type != SNAPSHOT_TYPES[self.measurement_type]:
+                raise ValueError("unexpected header")
+        except (OSError, ValueError, struct.error) as e:
+            print("Ignoring {} state snapshot: {}".format(self.measurement_type, e))
+            return False
+
+        age = time.time() - timestamp
+        if age < 0 or age > SNAPSHOT_MAX_AGE:
+            print("{} state snapshot is {:.0f} s old, not restored".format(self.measurement_type, age))
+            return False
+
+        self.set_states(state0, state1)
+        print("{} state restored from snapshot".format(self.measurement_type))
+        return True
+
+    def save_snapshot(self):
+        """
+        Write the algorithm state to the snapshot file atomically: the data
+        goes to a temporary file which then replaces the snapshot.
+        """
+        if self.snapshotFile is None:
+            return
+
+        state0, state1 = self.get_states()
+        data = struct.pack(SNAPSHOT_FORMAT, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SNAPSHOT_TYPES[self.measurement_type],
+                           int(state0), int(state1), time.time())
+        data += struct.pack('<I', zlib.crc32(data))
+
+        tmpFile = self.snapshotFile + '.tmp'
+        with open(tmpFile, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpFile, self.snapshotFile)
+        self.lastSnapshot = time.monotonic()
+
+    def import_legacy_history(self, legacyBufferFile):
+        if len(self.history) == 0:
+            with open(legacyBufferFile, 'r') as fin:
+                rawarray = fin.read().splitlines()
+            for rawdata in rawarray[-self.bufferSize:]:
+                if rawdata.strip():
+                    self.history.append(0, int(rawdata))
+            self.history.flush()
+        os.remove(legacyBufferFile)
+
+    def replay_history(self):
+        for timestamp, raw in self.history.read_all():
+            self.algorithm.process(raw)
+
+    def read_history(self):
+        """
+        Returns:
+        list: (unix time, raw ticks) of the buffered samples, oldest first.
+        """
+        return self.history.read_all()
+
+    def process(self, raw):
+        """
+        Feed one raw sample to the algorithm.
+
+        Returns:
+        int: The gas index.
+        """
+        raw = int(raw)
+        with self.lock:
+            index = self.algorithm.process(raw)
+            self.history.append(int(time.time()), raw & 0xFFFF)
+
+            now = time.monotonic()
+            if now - self.learningStart >= SNAPSHOT_MIN_LEARNING_TIME and now - self.lastSnapshot >= SNAPSHOT_INTERVAL:
+                try:
+                    self.save_snapshot()
+                except OSError as e:
+                    print("Error writing {} state snapshot: {}".format(self.measurement_type, e))
+        return index
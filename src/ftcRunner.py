@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import drivers.driver_co2 as sensorCO2
+import drivers.driver_pm as sensorPM2008
+import drivers.driver_sht as sensorRHT
+import drivers.driver_sgp4x as sensorTVOC2
+import drivers.driver_adcs as sensorADCs
+import batteryController
+import busAccess
+from sensorUtils import DEFAULT_TOPOLOGY, adcPATH_CO, adcPATH_NH3, adcPATH_NO2
+
+# Consolidated result of all checks
+FTC_OUTPUT_FILE = '/tmp/ftc_out'
+
+# Checks run when none are selected, the ones the production line ran one by one
+DEFAULT_CHECKS = ('CM1107', 'PM2008', 'SHT40', 'SGP41', 'Battery')
+
+
+def ftc_checks(topology = None, adcPaths = (adcPATH_CO, adcPATH_NH3, adcPATH_NO2)):
+    """
+    The factory test of every sensor, bound to the sensor's bus. The buses
+    come from busAccess, so checks sharing a bus take turns on it transfer
+    by transfer and the waits of all checks overlap.
+
+    Parameters:
+    topology (dict): I2C bus number per sensor name, overrides DEFAULT_TOPOLOGY.
+    adcPaths (tuple): Raw ADC files of the CO, NH3 and NO2 channels.
+
+    Returns:
+    dict: Function per check name, returning (passed, output_json).
+    """
+    buses = dict(DEFAULT_TOPOLOGY, **(topology or {}))
+    return {
+        'CM1107': lambda: sensorCO2.ftc_check(buses['CM1107'], busAccess.open_smbus(buses['CM1107'])),
+        'PM2008': lambda: sensorPM2008.ftc_check(buses['PM2008'], busAccess.open_smbus(buses['PM2008'])),
+        'SHT40': lambda: sensorRHT.ftc_check('internal', buses['SHT40'], busAccess.open_transceiver(buses['SHT40'])),
+        'SHT30': lambda: sensorRHT.ftc_check('external', buses['SHT30'], busAccess.open_transceiver(buses['SHT30'])),
+        'SGP41': lambda: sensorTVOC2.ftc_check('SGP41', buses['SGP41'], busAccess.open_transceiver(buses['SGP41'])),
+        'Battery': lambda: batteryController.ftc_check(buses['Battery'], busAccess.open_smbus(buses['Battery'])),
+        'MICS6814': lambda: sensorADCs.ftc_check(*adcPaths),
+    }
+
+def run_check(name, function):
+    """
+    Returns:
+    dict: Verdict, duration in seconds and output of one check. A check
+    that raises fails with the error message.
+    """
+    start = time.monotonic()
+    try:
+        passed, output_json = function()
+        error = None
+    except Exception as e:
+        print(f'Error in {name} check: {e}')
+        passed, output_json, error = False, None, str(e)
+    return {
+        'passed': bool(passed),
+        'duration': round(time.monotonic() - start, 3),
+        'result': output_json,
+        'error': error,
+    }
+
+def run_checks(checks):
+    """
+    Run the given checks concurrently.
+
+    Parameters:
+    checks (dict): Function per check name, see ftc_checks().
+
+    Returns:
+    dict: Overall verdict, start time, total duration and the result of every check.
+    """
+    started = time.time()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers = len(checks), thread_name_prefix = 'ftc') as executor:
+        futures = {name: executor.submit(run_check, name, function) for name, function in checks.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    return {
+        'passed': all(result['passed'] for result in results.values()),
+        'started': started,
+        'duration': round(time.monotonic() - start, 3),
+        'checks': results,
+    }
+
+def main():
+    msg = "Factory test of all sensors and the battery controller"
+    help_msg_checks = "CHECKS: comma separated list of CM1107 PM2008 SHT40 SHT30 SGP41 Battery MICS6814, default: " + ",".join(DEFAULT_CHECKS)
+    help_msg_output_file = "OUTPUT_FILE: specify file path to write the results of all checks, default: " + FTC_OUTPUT_FILE
+
+    parser = argparse.ArgumentParser(description=msg)
+    parser.add_argument("-c", "--checks", type=str, default=",".join(DEFAULT_CHECKS), required=False, help = help_msg_checks)
+    parser.add_argument("-o", "--output_file", type=str, default=FTC_OUTPUT_FILE, required=False, help = help_msg_output_file)
+    parser.add_argument("--simulate", action="store_true", help = "run against simulated hardware")
+    args = parser.parse_args()
+
+    adcPaths = (adcPATH_CO, adcPATH_NH3, adcPATH_NO2)
+    if args.simulate:
+        from simulatedHardware import SimulatedHardware
+        hardware = SimulatedHardware()
+        busAccess.use_hardware(hardware)
+        adcPaths = (hardware.iio.path(0), hardware.iio.path(6), hardware.iio.path(8))
+
+    checks = ftc_checks(adcPaths = adcPaths)
+    names = [name.strip() for name in args.checks.split(",") if name.strip()]
+    unknown = [name for name in names if name not in checks]
+    if unknown or not names:
+        print("invalid check(s): {}".format(", ".join(unknown)))
+        sys.exit(1)
+
+    output_json = run_checks({name: checks[name] for name in names})
+
+    with open(args.output_file, 'w') as f:
+        f.write(json.dumps(output_json))
+
+    for name, result in output_json['checks'].items():
+        print("{}: {} ({:.3f} s)".format(name, "OK" if result['passed'] else "FAIL", result['duration']))
+    if output_json['passed']:
+        print("sensor value(s) are normal, OK")
+        sys.exit(0)
+    else:
+        print("sensor value(s) are not within desired limits, FAIL")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
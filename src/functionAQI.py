@@ -55,3 +55,11 @@ def getQuality(json_file="/usr/local/artlite-opaq-app/data/AQI.json", dataPM1_0=
         return index_value,quality
     else:
         return json.dumps(index_dictionary) # json.dumps() function converts a Python object into a json string
+
+def getReadingQuality(reading, json_file="/usr/local/artlite-opaq-app/data/AQI.json", return_json=False):
+    """
+    getQuality() for a SensorReading. Invalid fields are left out of the index.
+    """
+    return getQuality(json_file, dataPM1_0=reading.get('pm1_0', -1), dataCO=reading.get('co', -1),
+                      dataNO2=reading.get('nox', -1), dataCO2=reading.get('co2', -1), dataVOC=reading.get('voc', -1),
+                      dataPM10=reading.get('pm10', -1), dataPM2_5=reading.get('pm2_5', -1), return_json=return_json)
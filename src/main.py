@@ -25,7 +25,9 @@ from pymodbus.device import ModbusDeviceIdentification
 # Local/Application-Specific Imports
 sys.path.append(os.path.abspath('/usr/local/artlite-opaq-app'))
 from sensorUtils import SensorHandler
-from functionAQI import getQuality
+from sensorBroker import SensorBroker
+from powerPolicy import PowerPolicy
+from functionAQI import getReadingQuality
 from arduino_iot_cloud import ArduinoCloudClient, \
     Task  # pip3.10 install arduino_iot_cloud, Successfully installed arduino_iot_cloud-1.4.0 cbor2-5.6.5 micropython-senml-0.1.1
 
@@ -47,6 +49,15 @@ cloud_array_lock = threading.Lock()
 client = None
 modbus_device = None
 lora_device = None
+sensor_handler = None  # Created on first read, keeps the sensor sessions open
+sensor_broker = None  # Shares the readings with other local applications
+power_policy = None  # Adapts sampling and transmitting to the battery, if configured
+
+# Seconds the sender waits at start for the first sample of every sensor
+FIRST_SAMPLES_TIMEOUT = 30
+
+# Readings waiting to be transmitted together when the power mode batches uplinks
+UPLINK_QUEUE_SIZE = 20
 
 # Time intervals
 MONITOR_INTERVAL = 10 * 60  # 10 minutes in seconds
@@ -478,7 +489,11 @@ def configure_lora(serial_port, ebyte_type, ADDH, ADDL, channel):
     set_mode(ebyte_type, "normal")
 
 
-def send_data(ser, device_id):
+def send_data(ser, device_id, readings=None, frame_age=False):
+    # Sends the given (sample time, reading) pairs one frame each, a new reading if None.
+    # With frame_age (the "frameAge" device setting) every frame ends with the age of its
+    # reading in seconds, so batched readings can be placed in time. Receivers that do not
+    # know this field need the frames without it, which is the default.
     try:
         # Define the start and end delimiters
         start_delimiter = b'\xcb\xda'
@@ -490,54 +505,88 @@ def send_data(ser, device_id):
         # data_payload = device_id.encode('utf-8')
         # Create the full message
         # full_message = start_delimiter + data_payload + end_delimiter
-        message = device_id + read_sensor()
-        # Send the message
-        # while True:
-        logging.debug(f"Sent Data: {message}")
-        json_str = json.dumps(message)
-
-        # Step 3: Encode the JSON string to bytes
-        json_bytes = json_str.encode('utf-8')
-
-        # Step 4: Convert the bytes to a hexadecimal string
-        hex_data = json_bytes.hex()
-        ser.write(start_delimiter + bytes.fromhex(hex_data) + end_delimiter)
-
-        time.sleep(1)  # Send data every second for testing purposes
+        for sampled, reading in readings or [read_sensor()]:
+            message = device_id + reading
+            if frame_age:
+                message += ";" + str(max(int(time.time() - sampled), 0))
+            # Send the message
+            # while True:
+            logging.debug(f"Sent Data: {message}")
+            json_str = json.dumps(message)
+
+            # Step 3: Encode the JSON string to bytes
+            json_bytes = json_str.encode('utf-8')
+
+            # Step 4: Convert the bytes to a hexadecimal string
+            hex_data = json_bytes.hex()
+            ser.write(start_delimiter + bytes.fromhex(hex_data) + end_delimiter)
+
+            time.sleep(1)  # Send data every second for testing purposes
     except serial.SerialException as e:
         logging.debug(f"Error: {e}")
     except KeyboardInterrupt:
         logging.debug("Stopped sending.")
 
 
+def create_sensor_handler(topology=None):
+    # Boards with several I2C controllers map the sensors to their buses
+    logging.debug(f"Creating sensor handler with bus topology: {topology}")
+    return SensorHandler(topology=topology)
+
+
+def start_sensor_scheduler(intervals=None, topology=None):
+    global sensor_handler
+
+    if sensor_handler is None:
+        sensor_handler = create_sensor_handler(topology)
+    if sensor_handler.scheduler is None:
+        logging.debug(f"Starting sensor scheduler with intervals: {intervals}")
+        sensor_handler.start_scheduler(intervals)
+
+
+def start_sensor_broker():
+    global sensor_broker
+
+    if sensor_broker is None:
+        logging.debug("Starting sensor broker.")
+        sensor_broker = SensorBroker(sensor_handler)
+        sensor_broker.start()
+
+
 def read_sensor():
-    __sensor = SensorHandler()
+    # Returns the unix time the reading was sampled and its LoRa payload
+    global sensor_handler
 
-    sensor_data = __sensor.handler()
+    if sensor_handler is None:
+        sensor_handler = create_sensor_handler()
 
-    dataTemp = sensor_data["CAIRRHTLEVEL_EXTERNAL_TEMP"]
-    dataHum = sensor_data["CAIRRHTLEVEL_EXTERNAL_HUM"]
-    dataCO2 = sensor_data["CAIRCO2LEVEL"]
-    dataVOC = sensor_data["CAIRTVOCLEVEL"]
-    dataNO2 = sensor_data["CAIRNO2LEVEL"]
-    dataPM1_0 = sensor_data["CAIRPM2008_1.0_TSI_LEVEL"]
-    dataPM2_5 = sensor_data["CAIRPM2008_2.5_TSI_LEVEL"]
-    dataPM10 = sensor_data["CAIRPM2008_10_TSI_LEVEL"]
+    degraded_sensors = sensor_handler.degraded_sensors()
+    if degraded_sensors:
+        logging.warning(f"Degraded sensors: {sensor_handler.breaker_status()}")
+
+    if sensor_handler.scheduler is not None:
+        # Latest values sampled in the background, no I2C access on the transmit path
+        reading = sensor_handler.cached_sensor_data()
+    else:
+        reading = sensor_handler.handler()
 
-    sttCairHealthLevel, sttCairHealthStatus = getQuality("/usr/local/artlite-opaq-app/data/AQI.json", dataNO2=dataNO2,
-                                                         dataVOC=dataVOC, dataPM10=dataPM10, dataPM1_0=dataPM1_0,
-                                                         dataCO2=dataCO2, dataPM2_5=dataPM2_5)
+    sttCairHealthLevel, sttCairHealthStatus = getReadingQuality(reading, "/usr/local/artlite-opaq-app/data/AQI.json")
 
+    return reading.timestamp, encode_reading(reading, sttCairHealthLevel)
+
+
+def encode_reading(reading, sttCairHealthLevel):
+    # LoRa payload, invalid fields are sent as -999
     serial_message = (
             ";" +
-            str(int(dataTemp)) + ";" +
-            str(int(dataHum)) + ";" +
-            str(dataCO2) + ";" +
-            str(dataVOC) + ";" +
-            str(dataNO2) + ";" +
-            str(dataPM1_0) + ";" +
-            str(dataPM2_5) + ";" +
-            str(dataPM10) + ";" +
+            str(int(reading.get('temperature'))) + ";" +
+            str(int(reading.get('humidity'))) + ";" +
+            str(reading.get('co2')) + ";" +
+            str(reading.get('voc')) + ";" +
+            str(reading.get('nox')) + ";" +
+            str(reading.get('pm1_0')) + ";" +
+            str(reading.get('pm2_5')) + ";" +
+            str(reading.get('pm10')) + ";" +
             str(int(sttCairHealthLevel))
     )
 
@@ -574,6 +623,7 @@ def parse_lora_data(data):
         "PM2_5": values[7],
         "PM10": values[8],
         "AQI": values[9] if len(values) > 9 else None,  # Handle cases with fewer fields
+        "Age": values[10].strip('"') if len(values) > 10 else None,  # Seconds since the reading was taken
     }
 
     return parsed_data
@@ -828,6 +878,7 @@ async def run_modbus_slave(modbus_array, modbus_device, context):
 async def main_task(context):
     global modbus_array
     global cloud_array
+    global power_policy
 
     try:
         with open("/usr/local/artlite-opaq-app/config/device_config.json", 'r') as f:
@@ -861,6 +912,17 @@ async def main_task(context):
 
         if unique_ids[device_id]["devType"] == "sender":
             logging.debug("Device is in Sender Mode!")
+            start_sensor_scheduler(unique_ids[device_id].get("samplingIntervals"),
+                                   unique_ids[device_id].get("sensorBuses"))
+            if unique_ids[device_id].get("sensorBroker", False):
+                start_sensor_broker()
+            # The first reading comes from the cache, wait until it holds a sample of every sensor
+            if not await asyncio.to_thread(sensor_handler.wait_for_samples, FIRST_SAMPLES_TIMEOUT):
+                logging.warning("Not every sensor was sampled before the first reading.")
+            if "powerPolicy" in unique_ids[device_id]:
+                power_policy = PowerPolicy.from_config(unique_ids[device_id]["powerPolicy"])
+                logging.debug(f"Power policy modes: {power_policy.modes}")
+            uplink_queue = deque(maxlen=UPLINK_QUEUE_SIZE)
             while True:
                 try:
                     uniqueAddr_str = unique_ids[device_id]["customAddr"]
@@ -877,6 +939,14 @@ async def main_task(context):
                     logging.debug(f"UniqueAddr Low Byte: {ADDL:#x}")
                     logging.debug(f"UniqueAddr High Byte: {ADDH:#x}")
 
+                    # On battery the readings are collected and sent together, the radio is only used once per batch
+                    if power_policy is not None:
+                        mode = power_policy.update(sensor_handler)
+                        uplink_queue.append(read_sensor())
+                        if len(uplink_queue) < mode.uplink_batch:
+                            await asyncio.sleep(mode.cycle_interval)
+                            continue
+
                     # Attempt to configure LoRa
                     while True:
                         try:
@@ -887,7 +957,8 @@ async def main_task(context):
 
                                 time.sleep(1)
 
-                                send_data(ser, device_id)
+                                send_data(ser, device_id, list(uplink_queue), unique_ids[device_id].get("frameAge", False))
+                                uplink_queue.clear()
 
                                 end_time = time.time() + 5  # Calculate the end time (5 seconds from now)
 
@@ -910,6 +981,9 @@ async def main_task(context):
                             set_mode(ebyte_type, "normal")
                             time.sleep(2)  # Give it some time before retrying
 
+                    if power_policy is not None:
+                        await asyncio.sleep(power_policy.mode.cycle_interval)
+
                 except KeyError as e:
                     logging.debug(f"Configuration for device ID {device_id} is incomplete: {e}")
                     break
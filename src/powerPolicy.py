@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# Battery status reported by batteryController.battery_level()
+BATTERY_NOT_PLUGGED = 0
+BATTERY_PLUGGED = 1
+
+# Battery level thresholds in percent
+LOW_LEVEL = 30
+CRITICAL_LEVEL = 15
+# A lower mode is only left once the level is this far above its threshold
+HYSTERESIS = 5
+
+# Age in seconds up to which the power policy uses a cached battery read
+BATTERY_MAX_AGE = 60
+
+
+class PowerMode:
+    """
+    How much a sender node samples and transmits.
+
+    Parameters:
+    name (str): Mode name.
+    interval_scale (float): Factor applied to all sampling intervals.
+    skip (tuple): Sensors not sampled, their fan or heater is turned off.
+    cycle_interval (float): Seconds between two readings of the sender loop.
+    uplink_batch (int): Readings collected before they are transmitted in one radio session.
+    """
+
+    def __init__(self, name, interval_scale = 1, skip = (), cycle_interval = 0, uplink_batch = 1):
+        self.name = name
+        self.interval_scale = interval_scale
+        self.skip = tuple(skip)
+        self.cycle_interval = cycle_interval
+        self.uplink_batch = uplink_batch
+
+    def __repr__(self):
+        return (f'PowerMode({self.name!r}, interval_scale={self.interval_scale}, skip={self.skip}, '
+                f'cycle_interval={self.cycle_interval}, uplink_batch={self.uplink_batch})')
+
+
+def default_modes():
+    """
+    Returns:
+    dict: PowerMode per name, from most to least power.
+    normal samples and transmits as before. saving turns the SGP41
+    hotplate off, its gas index needs 1 s samples and cannot be
+    stretched, samples the rest 4 times slower and sends 5 readings per
+    radio session. critical also stops the PM2008 fan.
+    """
+    return {
+        'normal': PowerMode('normal'),
+        'saving': PowerMode('saving', 4, ('SGP41',), 60, 5),
+        'critical': PowerMode('critical', 10, ('SGP41', 'PM2008'), 300, 6),
+    }
+
+
+class PowerPolicy:
+    """
+    Selects the PowerMode of a sender node from its battery.
+
+    normal while on external power, saving on battery or when the level
+    is below low_level, critical on battery below critical_level. Any
+    other status, a charger fault or a failed read, keeps the mode. The
+    battery is read through SensorHandler.read_battery() with a max age,
+    so evaluating the policy costs at most one charger read per
+    battery_max_age and usually none, the scheduler keeps it fresh.
+
+    Parameters:
+    modes (dict): Overrides of default_modes(), PowerMode per name.
+    low_level (float): Battery level in percent below which the node saves power.
+    critical_level (float): Battery level in percent below which the node runs critical.
+    hysteresis (float): Percent the level has to rise above a threshold to leave a lower mode.
+    battery_max_age (float): Seconds a cached battery read is used.
+    """
+
+    def __init__(self, modes = None, low_level = LOW_LEVEL, critical_level = CRITICAL_LEVEL,
+                 hysteresis = HYSTERESIS, battery_max_age = BATTERY_MAX_AGE):
+        self.modes = dict(default_modes(), **(modes or {}))
+        unknown = set(self.modes) - set(default_modes())
+        if unknown:
+            raise ValueError(f'Unknown power modes: {sorted(unknown)}')
+        self.ranks = {name: rank for rank, name in enumerate(default_modes())}
+        self.low_level = low_level
+        self.critical_level = critical_level
+        self.hysteresis = hysteresis
+        self.battery_max_age = battery_max_age
+        self.mode = self.modes['normal']
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the policy from the "powerPolicy" device setting: lowLevel,
+        criticalLevel, hysteresis, batteryMaxAge and per mode name the
+        PowerMode fields to override.
+        """
+        config = config or {}
+        modes = {}
+        for name, fields in config.get('modes', {}).items():
+            mode = default_modes().get(name)
+            if mode is None:
+                raise ValueError(f'Unknown power mode: {name}')
+            modes[name] = PowerMode(name,
+                                    fields.get('intervalScale', mode.interval_scale),
+                                    fields.get('skip', mode.skip),
+                                    fields.get('cycleInterval', mode.cycle_interval),
+                                    fields.get('uplinkBatch', mode.uplink_batch))
+        return cls(modes,
+                   config.get('lowLevel', LOW_LEVEL),
+                   config.get('criticalLevel', CRITICAL_LEVEL),
+                   config.get('hysteresis', HYSTERESIS),
+                   config.get('batteryMaxAge', BATTERY_MAX_AGE))
+
+    def below(self, level, threshold, name):
+        # Staying in or above the mode the threshold leads to needs the hysteresis on top
+        if self.ranks[self.mode.name] >= self.ranks[name]:
+            threshold += self.hysteresis
+        return level < threshold
+
+    def select(self, level, status):
+        """
+        Parameters:
+        level (float): Battery level in percent, -999 if below the measurable range or unknown.
+        status (int): Battery status, None if the battery could not be read.
+        Only BATTERY_PLUGGED and BATTERY_NOT_PLUGGED change the mode.
+
+        Returns:
+        PowerMode: The mode for this battery state.
+        """
+        if status == BATTERY_PLUGGED:
+            low = level != -999 and self.below(level, self.low_level, 'saving')
+            return self.modes['saving' if low else 'normal']
+        if status == BATTERY_NOT_PLUGGED:
+            if level == -999:
+                level = 0 # on battery the level is only invalid below the minimum voltage
+            return self.modes['critical' if self.below(level, self.critical_level, 'critical') else 'saving']
+        return self.mode # fault or unknown status, keep the mode until the charger reports again
+
+    def update(self, sensorHandler):
+        """
+        Read the battery state, cached, select the mode and apply it to
+        the sensor handler if it changed.
+
+        Returns:
+        PowerMode: The current mode.
+        """
+        battery = sensorHandler.read_battery(self.battery_max_age)
+        level, status = (None, None) if battery == -999 else battery
+        mode = self.select(level, status)
+        if mode is not self.mode:
+            print(f'Power mode {self.mode.name} -> {mode.name} (battery level {level}, status {status})')
+            self.mode = mode
+            sensorHandler.set_power_mode(mode)
+        return mode
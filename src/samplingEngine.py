@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor, Future
+
+class SamplingEngine:
+    """
+    Reads several sensor sessions at the same time.
+
+    Each read runs on its own worker thread. The sessions' buses come from
+    busAccess, which serialises the individual transfers on a bus but not
+    the waits between a measure command and its result, so the waits of
+    all sensors overlap. A full cycle takes about as long as the slowest
+    sensor instead of the sum of all of them.
+
+    Parameters:
+    max_workers (int): Number of sensors that can be read at the same time.
+    """
+
+    def __init__(self, max_workers = 6):
+        self.executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = 'sensor')
+
+    def submit(self, session, **kwargs):
+        """
+        Start reading a session in the background.
+
+        Returns:
+        concurrent.futures.Future: Resolves to the session's read() result.
+        """
+        return self.executor.submit(session.read, **kwargs)
+
+    def call(self, function, *args, **kwargs):
+        """
+        Run any function on the engine's worker threads.
+
+        Returns:
+        concurrent.futures.Future: Resolves to the function's result.
+        """
+        return self.executor.submit(function, *args, **kwargs)
+
+    def resolved(self, value):
+        """
+        Returns:
+        concurrent.futures.Future: Already completed with value, for reads that are skipped.
+        """
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def sample(self, sessions):
+        """
+        Read all given sessions concurrently and wait for them.
+
+        Returns:
+        dict: Read result per sensor name.
+        """
+        futures = {session.sensorName: self.submit(session) for session in sessions}
+        return {name: future.result() for name, future in futures.items()}
+
+    def shutdown(self):
+        self.executor.shutdown(wait = True)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+import os
+import grp
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import socket
+import argparse
+import threading
+import socketserver
+from sensorReading import SensorReading, FIELDS, FIELD_NAMES
+
+# Unix socket of the broker, clients send one JSON command per line
+BROKER_SOCKET = '/run/artlite-sensors.sock'
+
+# Group of the local applications allowed to connect to the broker socket
+BROKER_GROUP = 'artlite-sensors'
+
+# Shared memory segment with the latest reading
+SEGMENT_PATH = '/dev/shm/artlite-sensors'
+
+# Segment layout: header (magic, version, field count, sequence number,
+# CRC32 of the reading) followed by the reading (timestamp, valid bitmask,
+# one double per field)
+SEGMENT_MAGIC = b'SNSR'
+SEGMENT_VERSION = 2
+SEGMENT_HEADER_FORMAT = '<4sBxHII'
+SEGMENT_SEQUENCE_OFFSET = 8
+SEGMENT_CHECKSUM_OFFSET = 12
+SEGMENT_HEADER_SIZE = struct.calcsize(SEGMENT_HEADER_FORMAT)
+SEGMENT_READING = struct.Struct('<dI4x' + 'd' * len(FIELDS))
+SEGMENT_SIZE = SEGMENT_HEADER_SIZE + SEGMENT_READING.size
+
+# Seconds between two published readings
+PUBLISH_INTERVAL = 1
+
+
+class SensorSegment:
+    """
+    Shared memory segment holding the latest SensorReading, written by the
+    broker and read by any number of local processes.
+
+    Writes are guarded by a seqlock: the sequence number is odd while the
+    reading is written and is incremented again when it is complete. A
+    reader copies the reading straight out of the mapping and retries if
+    the sequence number was odd or changed meanwhile, so readers never
+    block the writer. Python has no memory barriers, so on weakly ordered
+    CPUs (ARM) another process may see the new sequence number before the
+    new reading. The writer therefore also stores a CRC32 of the reading
+    and the reader retries until the reading matches it.
+
+    Parameters:
+    path (str): Segment file, normally in /dev/shm.
+    create (bool): Create the segment (writer) instead of opening it (reader).
+    """
+
+    def __init__(self, path = SEGMENT_PATH, create = False):
+        self.path = path
+        if create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            os.ftruncate(fd, SEGMENT_SIZE)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+        try:
+            self.map = mmap.mmap(fd, SEGMENT_SIZE, access = mmap.ACCESS_WRITE if create else mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+        if create:
+            self.sequence = 0
+            struct.pack_into(SEGMENT_HEADER_FORMAT, self.map, 0, SEGMENT_MAGIC, SEGMENT_VERSION, len(FIELDS), 0,
+                             zlib.crc32(bytes(SEGMENT_READING.size)))
+        else:
+            magic, version, count, sequence, checksum = struct.unpack_from(SEGMENT_HEADER_FORMAT, self.map, 0)
+            if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION or count != len(FIELDS):
+                raise ValueError('{} is not a compatible sensor segment'.format(path))
+
+    def write(self, reading):
+        values = [float('nan') if getattr(reading, name) is None else float(getattr(reading, name)) for name in FIELD_NAMES]
+        self.sequence += 1
+        struct.pack_into('<I', self.map, SEGMENT_SEQUENCE_OFFSET, self.sequence)
+        data = SEGMENT_READING.pack(reading.timestamp, reading.valid, *values)
+        self.map[SEGMENT_HEADER_SIZE:SEGMENT_SIZE] = data
+        struct.pack_into('<I', self.map, SEGMENT_CHECKSUM_OFFSET, zlib.crc32(data))
+        self.sequence += 1
+        struct.pack_into('<I', self.map, SEGMENT_SEQUENCE_OFFSET, self.sequence)
+
+    def read(self):
+        """
+        Returns:
+        SensorReading: The latest reading, None if nothing has been published yet.
+        """
+        while True:
+            before = struct.unpack_from('<I', self.map, SEGMENT_SEQUENCE_OFFSET)[0]
+            if not before & 1:
+                data = self.map[SEGMENT_HEADER_SIZE:SEGMENT_SIZE]
+                checksum = struct.unpack_from('<I', self.map, SEGMENT_CHECKSUM_OFFSET)[0]
+                if struct.unpack_from('<I', self.map, SEGMENT_SEQUENCE_OFFSET)[0] == before and zlib.crc32(data) == checksum:
+                    data = SEGMENT_READING.unpack(data)
+                    break
+            time.sleep(0) # let the writer finish
+
+        if before == 0:
+            return None
+        timestamp, valid, values = data[0], data[1], data[2:]
+        return SensorReading([value if valid >> index & 1 else None for index, value in enumerate(values)], timestamp)
+
+    def close(self):
+        self.map.close()
+
+
+def reading_message(reading, fields = None):
+    """
+    Returns:
+    bytes: The reading as one JSON line, invalid fields are null.
+    """
+    names = FIELD_NAMES if fields is None else fields
+    message = {'timestamp': reading.timestamp, 'values': {name: getattr(reading, name) for name in names}}
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+class BrokerRequestHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection. Commands, one JSON object per line:
+    {"cmd": "get"} answers the latest reading once,
+    {"cmd": "subscribe", "fields": [...]} sends every published reading
+    (optionally only the given fields) until the client disconnects.
+    """
+
+    def handle(self):
+        broker = self.server.broker
+        for line in self.rfile:
+            try:
+                command = json.loads(line)
+                if not isinstance(command, dict):
+                    raise ValueError('command is not a JSON object')
+                fields = command.get('fields')
+                if fields is not None and (not isinstance(fields, list) or not all(isinstance(name, str) for name in fields)):
+                    raise ValueError('fields is not a list of field names')
+                if fields is not None and not set(fields) <= set(FIELD_NAMES):
+                    raise ValueError('unknown fields')
+            except ValueError as e:
+                self.wfile.write((json.dumps({'error': str(e)}) + '\n').encode('utf-8'))
+                continue
+
+            if command.get('cmd') == 'get':
+                self.wfile.write(reading_message(broker.latest(), fields))
+            elif command.get('cmd') == 'subscribe':
+                broker.stream(self.wfile, fields)
+                return
+            else:
+                self.wfile.write(b'{"error": "unknown command"}\n')
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SensorBroker:
+    """
+    Shares the readings of one SensorHandler with other local
+    applications, so only this process drives the sensors.
+
+    The handler's scheduler samples the sensors; every publish interval
+    the latest cached reading is written to the shared memory segment and
+    sent to the subscribers of the Unix socket. Each subscriber is served
+    by its own thread, so a slow client does not hold up the others.
+
+    Parameters:
+    handler (SensorHandler): Handler with a running scheduler.
+    socketPath (str): Unix socket for subscribers.
+    segmentPath (str): Shared memory segment.
+    interval (float): Seconds between published readings.
+    socketGroup (str): Group that may use the socket and segment besides the owner.
+    """
+
+    def __init__(self, handler, socketPath = BROKER_SOCKET, segmentPath = SEGMENT_PATH, interval = PUBLISH_INTERVAL,
+                 socketGroup = BROKER_GROUP):
+        self.handler = handler
+        self.socketPath = socketPath
+        self.socketGroup = socketGroup
+        self.interval = interval
+        self.segment = SensorSegment(segmentPath, create = True)
+        self.condition = threading.Condition()
+        self.reading = None
+        self.sequence = 0
+        self.stopEvent = threading.Event()
+        self.server = None
+        self.threads = []
+
+    def latest(self):
+        with self.condition:
+            return self.reading if self.reading is not None else self.handler.cached_sensor_data()
+
+    def stream(self, wfile, fields = None):
+        """
+        Send every published reading to a subscriber until it disconnects.
+        """
+        sequence = self.sequence
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.sequence != sequence or self.stopEvent.is_set())
+                if self.stopEvent.is_set():
+                    return
+                sequence, reading = self.sequence, self.reading
+            try:
+                wfile.write(reading_message(reading, fields))
+                wfile.flush()
+            except OSError:
+                return
+
+    def publish(self, reading):
+        with self.condition:
+            self.reading = reading
+            self.sequence += 1
+            self.segment.write(reading)
+            self.condition.notify_all()
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            self.publish(self.handler.cached_sensor_data())
+
+    def start(self):
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        self.server = BrokerServer(self.socketPath, BrokerRequestHandler)
+        self.server.broker = self
+        self.restrict(self.socketPath, 0o660)
+        self.restrict(self.segment.path, 0o640)
+        self.stopEvent.clear()
+        self.threads = [threading.Thread(target = self.server.serve_forever, name = 'broker-server', daemon = True),
+                        threading.Thread(target = self.run, name = 'broker-publisher', daemon = True)]
+        for thread in self.threads:
+            thread.start()
+
+    def restrict(self, path, mode):
+        """
+        Give path to socketGroup with mode, so only the owner and that
+        group can subscribe or map the segment. Without that group the
+        file keeps the group of the process.
+        """
+        try:
+            os.chown(path, -1, grp.getgrnam(self.socketGroup).gr_gid)
+        except KeyError:
+            print(f'Group {self.socketGroup} does not exist, {path} keeps the group of the process')
+        os.chmod(path, mode)
+
+    def stop(self):
+        with self.condition:
+            self.stopEvent.set()
+            self.condition.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            os.remove(self.socketPath)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.segment.close()
+
+
+def subscribe(socketPath = BROKER_SOCKET, fields = None):
+    """
+    Client side: yield the readings published by the broker as dicts.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socketPath)
+        client.sendall((json.dumps({'cmd': 'subscribe', 'fields': fields}) + '\n').encode('utf-8'))
+        for line in client.makefile('r'):
+            yield json.loads(line)
+
+
+def main():
+    msg = "Sensor broker: samples the sensors once and shares the readings"
+    parser = argparse.ArgumentParser(description=msg)
+    parser.add_argument("-s", "--socket", type=str, default=BROKER_SOCKET, required=False, help="unix socket path")
+    parser.add_argument("-m", "--segment", type=str, default=SEGMENT_PATH, required=False, help="shared memory segment path")
+    parser.add_argument("-g", "--group", type=str, default=BROKER_GROUP, required=False, help="group allowed to connect to the socket")
+    args = parser.parse_args()
+
+    from sensorUtils import SensorHandler
+
+    handler = SensorHandler()
+    handler.start_scheduler()
+    broker = SensorBroker(handler, args.socket, args.segment, socketGroup = args.group)
+    broker.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+        handler.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
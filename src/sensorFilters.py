@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import threading
+from bisect import bisect_left, insort
+from sensorReading import SensorReading, FIELD_NAMES
+
+# Scale factor that turns the median absolute deviation into an estimate
+# of the standard deviation for normally distributed values
+MAD_SCALE = 1.4826
+
+
+class HampelFilter:
+    """
+    Replaces outliers by the median of the last size samples. A sample is
+    an outlier if it is more than threshold scaled MADs away from the
+    median, and at least minDeviation.
+
+    The samples are kept twice in preallocated lists: in arrival order
+    (ring) to know which one drops out, and sorted to find the median by
+    index. An update is one bisect and one list shift of at most size
+    elements, the MAD is selected from the sorted window in O(size).
+
+    Parameters:
+    size (int): Window length in samples.
+    threshold (float): Outlier threshold in scaled MADs.
+    minDeviation (float): Deviations up to this are never outliers, so
+    small steps in flat, quantised signals (PM counts) pass.
+    """
+
+    def __init__(self, size = 7, threshold = 3.0, minDeviation = 0.0):
+        self.size = size
+        self.threshold = threshold
+        self.minDeviation = minDeviation
+        self.ring = [0.0] * size
+        self.sorted = []
+        self.index = 0
+
+    def median(self):
+        count = len(self.sorted)
+        middle = count // 2
+        if count % 2:
+            return self.sorted[middle]
+        return (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    def mad(self, median):
+        """
+        Median of the absolute deviations, picked by walking outwards from
+        the median of the sorted window, where the deviations grow on both sides.
+        """
+        values = self.sorted
+        count = len(values)
+        left = bisect_left(values, median) - 1
+        right = left + 1
+        deviations = []
+        while len(deviations) <= count // 2:
+            if right >= count or (left >= 0 and median - values[left] <= values[right] - median):
+                deviations.append(median - values[left])
+                left -= 1
+            else:
+                deviations.append(values[right] - median)
+                right += 1
+        if count % 2:
+            return deviations[count // 2]
+        return (deviations[count // 2 - 1] + deviations[count // 2]) / 2
+
+    def update(self, value, timestamp):
+        if len(self.sorted) == self.size:
+            old = self.ring[self.index]
+            del self.sorted[bisect_left(self.sorted, old)]
+        self.ring[self.index] = value
+        self.index = (self.index + 1) % self.size
+        insort(self.sorted, value)
+
+        median = self.median()
+        limit = max(self.threshold * MAD_SCALE * self.mad(median), self.minDeviation)
+        return median if abs(value - median) > limit else value
+
+
+class EmaFilter:
+    """
+    Exponential moving average.
+
+    Parameters:
+    alpha (float): Weight of the new sample, 0 < alpha <= 1.
+    """
+
+    def __init__(self, alpha = 0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value, timestamp):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class RateLimitFilter:
+    """
+    Limits how fast the value can change between two samples.
+
+    Parameters:
+    maxRate (float): Largest change per second.
+    """
+
+    def __init__(self, maxRate):
+        self.maxRate = maxRate
+        self.value = None
+        self.timestamp = None
+
+    def update(self, value, timestamp):
+        if self.value is not None:
+            step = self.maxRate * max(timestamp - self.timestamp, 0)
+            value = min(max(value, self.value - step), self.value + step)
+        self.value = value
+        self.timestamp = timestamp
+        return value
+
+
+class ChannelFilter:
+    """
+    Chain of filters of one channel with the last output.
+
+    A sample is identified by its timestamp: a value with the same
+    timestamp as the last one is the same sample read again from the
+    cache and returns the last output without changing the filter state.
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.timestamp = None
+        self.output = None
+
+    def update(self, value, timestamp):
+        if timestamp is not None and timestamp == self.timestamp:
+            return self.output
+        for f in self.filters:
+            value = f.update(value, timestamp)
+        self.timestamp = timestamp
+        self.output = value
+        return value
+
+
+def default_filters():
+    """
+    Returns:
+    dict: Filter chain per field name. PM spikes are replaced by the
+    window median, CO2 is median filtered and rate limited.
+    """
+    filters = {name: [HampelFilter(7, 3.0, minDeviation = 5)] for name in ('pm1_0', 'pm2_5', 'pm10')}
+    filters['co2'] = [HampelFilter(5, 3.0, minDeviation = 20), RateLimitFilter(50)]
+    return filters
+
+
+class FilterStage:
+    """
+    Filters the channels of SensorReadings. Fields without a filter chain
+    and invalid fields pass unchanged, an invalid field does not change
+    the state of its chain. The readings of all threads, e.g. the sender
+    loop and the sensor broker, go through the filters one at a time.
+
+    Parameters:
+    filters (dict): Filter chain (list of filters) per field name, see default_filters().
+    """
+
+    def __init__(self, filters = None):
+        filters = default_filters() if filters is None else filters
+        unknown = set(filters) - set(FIELD_NAMES)
+        if unknown:
+            raise ValueError(f'Unknown fields in filters: {sorted(unknown)}')
+        self.channels = {name: ChannelFilter(chain) for name, chain in filters.items()}
+        self.lock = threading.Lock()
+
+    def apply(self, reading, sampleTimes = None):
+        """
+        Parameters:
+        reading (SensorReading): Raw reading.
+        sampleTimes (dict): Time each field was sampled, the reading's timestamp if not given.
+
+        Returns:
+        SensorReading: The filtered reading, with the same timestamp.
+        """
+        values = []
+        with self.lock:
+            for name in FIELD_NAMES:
+                value = getattr(reading, name)
+                channel = self.channels.get(name)
+                if value is not None and channel is not None:
+                    value = channel.update(value, (sampleTimes or {}).get(name, reading.timestamp))
+                values.append(value)
+        return SensorReading(values, reading.timestamp)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import busAccess
+
+# I2C address of every supported sensor
+SENSOR_ADDRESSES = {
+    'CM1107': 0x31,
+    'PM2008': 0x28,
+    'SHT30': 0x44,
+    'SHT40': 0x45,
+    'SGP41': 0x59,
+    'Battery': 0x6A, # BQ25887
+}
+
+
+def probe(bus, addr):
+    """
+    Check whether a device acknowledges its address the way i2cdetect
+    does: a read byte at 0x30-0x37, where a quick write can upset devices
+    such as the CM1107, and a quick write, which sends no data, everywhere
+    else. The Sensirion sensors at 0x59 and above answer a quick write,
+    but not a read without a command.
+
+    Returns:
+    bool: True if the device answered.
+    """
+    try:
+        if 0x30 <= addr <= 0x37:
+            bus.read_byte(addr)
+        else:
+            bus.write_quick(addr)
+        return True
+    except OSError:
+        return False
+
+
+class SensorInventory:
+    """
+    Which sensors are fitted on this board.
+
+    scan() probes the address of every sensor once and caches the result,
+    so sensors that are not fitted are never initialised or scheduled.
+    Call scan() again to refresh the inventory, e.g. after a sensor has
+    been plugged in.
+
+    Parameters:
+    sensorBuses (dict): I2C bus number per sensor name.
+    """
+
+    def __init__(self, sensorBuses):
+        self.sensorBuses = sensorBuses
+        self.lock = threading.Lock()
+        self.present = {}
+        self.scanTime = None
+
+    def scan(self):
+        """
+        Returns:
+        dict: True or False per sensor name.
+        """
+        present = {}
+        for busNo in sorted(set(self.sensorBuses.values())):
+            names = [name for name, sensorBus in self.sensorBuses.items() if sensorBus == busNo]
+            try:
+                bus = busAccess.open_smbus(busNo)
+            except OSError as e:
+                print(f'Error opening I2C bus {busNo}: {e}')
+                present.update({name: False for name in names})
+                continue
+            try:
+                for name in names:
+                    present[name] = probe(bus, SENSOR_ADDRESSES[name])
+            finally:
+                bus.close()
+
+        with self.lock:
+            self.present = present
+            self.scanTime = time.time()
+        print(f'Sensor inventory: {present}')
+        return dict(present)
+
+    def is_present(self, name):
+        with self.lock:
+            return self.present.get(name, False)
+
+    def present_sensors(self):
+        with self.lock:
+            return [name for name, present in self.present.items() if present]
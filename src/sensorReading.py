@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import time
+
+# Field table of a reading: attribute name and the legacy sensorData key
+FIELDS = (
+    ('temperature', 'CAIRRHTLEVEL_EXTERNAL_TEMP'),
+    ('humidity', 'CAIRRHTLEVEL_EXTERNAL_HUM'),
+    ('co2', 'CAIRCO2LEVEL'),
+    ('voc', 'CAIRTVOCLEVEL'),
+    ('nox', 'CAIRNO2LEVEL'),
+    ('co', 'CAIRCOLEVEL'),
+    ('pm1_0', 'CAIRPM2008_1.0_TSI_LEVEL'),
+    ('pm2_5', 'CAIRPM2008_2.5_TSI_LEVEL'),
+    ('pm10', 'CAIRPM2008_10_TSI_LEVEL'),
+    ('pm0_3_count', 'CAIRPM2008_0.3_L_LEVEL'),
+    ('pm0_5_count', 'CAIRPM2008_0.5_L_LEVEL'),
+    ('pm1_0_count', 'CAIRPM2008_1.0_L_LEVEL'),
+    ('pm2_5_count', 'CAIRPM2008_2.5_L_LEVEL'),
+    ('pm5_count', 'CAIRPM2008_5_L_LEVEL'),
+    ('pm10_count', 'CAIRPM2008_10_L_LEVEL'),
+    ('pm1_0_grimm', 'CAIRPM2008_1.0_GRIMM_LEVEL'),
+    ('pm2_5_grimm', 'CAIRPM2008_2.5_GRIMM_LEVEL'),
+    ('pm10_grimm', 'CAIRPM2008_10_GRIMM_LEVEL'),
+    ('battery_level', 'STT_BATTERY_LEVEL'),
+    ('battery_status', 'STT_CAIR_BATTERY_STATUS'),
+)
+FIELD_NAMES = tuple(name for name, key in FIELDS)
+FIELD_INDEX = {name: index for index, name in enumerate(FIELD_NAMES)}
+
+# Fields filled from the PM2008 driver result, which uses the legacy keys
+PM2008_FIELDS = tuple((FIELD_INDEX[name], key) for name, key in FIELDS if key.startswith('CAIRPM2008'))
+
+
+class SensorReading:
+    """
+    Immutable record of one measurement cycle.
+
+    Every field of FIELDS is an attribute. A field the cycle could not
+    measure is None and its bit in valid is cleared, so no -999 sentinel
+    has to be checked; get() returns a default for it instead.
+
+    Parameters:
+    values (sequence): One value per field in FIELDS order, None if invalid.
+    timestamp (float): Unix time of the cycle, now if not given.
+    """
+    __slots__ = FIELD_NAMES + ('valid', 'timestamp')
+
+    def __init__(self, values, timestamp = None):
+        valid = 0
+        for index, value in enumerate(values):
+            object.__setattr__(self, FIELD_NAMES[index], value)
+            if value is not None:
+                valid |= 1 << index
+        object.__setattr__(self, 'valid', valid)
+        object.__setattr__(self, 'timestamp', time.time() if timestamp is None else timestamp)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('SensorReading is immutable')
+
+    def is_valid(self, name):
+        return bool(self.valid & (1 << FIELD_INDEX[name]))
+
+    def get(self, name, default = -999):
+        value = getattr(self, name)
+        return default if value is None else value
+
+    def as_dict(self, default = -999):
+        """
+        Returns:
+        dict: The reading with the legacy sensorData keys, invalid fields set to default.
+        """
+        return {key: self.get(name, default) for name, key in FIELDS}
+
+    def __repr__(self):
+        return 'SensorReading({})'.format(', '.join('{}={}'.format(name, getattr(self, name)) for name in FIELD_NAMES))
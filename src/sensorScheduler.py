@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import time
+import heapq
+import threading
+
+# Default sampling interval per job in seconds
+DEFAULT_INTERVALS = {
+    'RHT': 1,
+    'SGP41': 1,
+    'CM1107': 5,
+    'PM2008': 10,
+    'Battery': 60,
+}
+
+
+class LatestValueCache:
+    """
+    Thread-safe store of the latest value of every sensor, with the time it was sampled.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def update(self, name, value, timestamp = None):
+        with self.lock:
+            self.values[name] = (value, time.time() if timestamp is None else timestamp)
+
+    def get(self, name, default = -999):
+        with self.lock:
+            return self.values.get(name, (default, None))[0]
+
+    def get_entry(self, name, default = -999):
+        """
+        Returns:
+        tuple: (value, unix time of the sample), (default, None) if never sampled.
+        """
+        with self.lock:
+            return self.values.get(name, (default, None))
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class SchedulerJob:
+    """
+    A function sampled periodically by the SensorScheduler.
+
+    Parameters:
+    name (str): Cache key of the result.
+    interval (float): Sampling interval in seconds.
+    function (callable): Reads the sensor, returns its value or -999.
+    cache_names (list): If given, the function returns one value per name
+    and each is cached under its own key instead of name.
+    """
+
+    def __init__(self, name, interval, function, cache_names = None):
+        self.name = name
+        self.interval = interval
+        self.function = function
+        self.cache_names = cache_names
+        self.future = None
+        self.sampled = threading.Event() # set once the first result is cached
+
+
+class SensorScheduler:
+    """
+    Background thread that runs each job at its own interval and stores
+    the results in a LatestValueCache.
+
+    Due jobs are started on the SamplingEngine so they overlap. A job that
+    is still running when it is due again skips that slot.
+    """
+
+    def __init__(self, engine, jobs, cache):
+        self.engine = engine
+        self.jobs = jobs
+        self.cache = cache
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target = self.run, name = 'sensor-scheduler', daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop scheduling and wait for the jobs still running.
+        """
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for job in self.jobs:
+            if job.future is not None:
+                job.future.result()
+
+    def run_job(self, job):
+        try:
+            result = job.function()
+        except Exception as e:
+            print(f'Error sampling {job.name}: {e}')
+            result = -999
+
+        if job.cache_names is None:
+            self.cache.update(job.name, result)
+        elif result == -999:
+            for name in job.cache_names:
+                self.cache.update(name, -999)
+        else:
+            for name, value in zip(job.cache_names, result):
+                self.cache.update(name, value)
+        job.sampled.set()
+
+    def wait_sampled(self, timeout = None):
+        """
+        Wait until every job has cached its first result.
+
+        Returns:
+        bool: True if all jobs have, False if the timeout expired first.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        for job in self.jobs:
+            remaining = None if end is None else max(end - time.monotonic(), 0)
+            if not job.sampled.wait(remaining):
+                return False
+        return True
+
+    def run(self):
+        now = time.monotonic()
+        queue = [(now, index, job) for index, job in enumerate(self.jobs)]
+        heapq.heapify(queue)
+
+        while not self.stopEvent.is_set():
+            due, index, job = queue[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self.stopEvent.wait(delay)
+                continue
+
+            heapq.heappop(queue)
+            if job.future is None or job.future.done():
+                job.future = self.engine.call(self.run_job, job)
+
+            now = time.monotonic()
+            next_due = due + job.interval
+            if next_due < now:
+                next_due = now + job.interval # fell behind, skip the missed slots
+            heapq.heappush(queue, (next_due, index, job))
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import busAccess
+from circuitBreaker import CircuitBreaker
+
+def read_failed(data):
+    """
+    A driver reports a failed read as -999, or as a dict or tuple of
+    -999 values, e.g. the PM2008 for an invalid or closed frame.
+    """
+    if isinstance(data, dict):
+        data = list(data.values())
+    if isinstance(data, (tuple, list)):
+        return all(value == -999 for value in data)
+    return data == -999
+
+class SensorSession:
+    """
+    Long-lived handle of a single sensor.
+
+    The bus (smbus.SMBus or LinuxI2cTransceiver, wrapped by busAccess so it
+    can be shared between threads) and the device object are created by
+    the driver's init() on first use and kept open across measurement
+    cycles. A failed read closes the session, the next read re-initialises
+    the sensor.
+
+    Every session has a CircuitBreaker: after repeated failures the sensor
+    is not probed any more and read() returns -999 straight away until the
+    breaker allows the next probe.
+
+    Parameters:
+    sensor (module): Driver module providing init() and read().
+    busNo (int): I2C bus number of the sensor.
+    sensorName (str): Name used in log messages.
+    sensorModel (str): Sensor model for SGP4x sensors, None otherwise.
+    conditioning (bool): Run SGP4x conditioning when the session is opened.
+    addr (int): I2C address for SHT sensors, None otherwise.
+    """
+
+    def __init__(self, sensor, busNo, sensorName, sensorModel = None, conditioning = False, addr = None):
+        self.sensor = sensor
+        self.busNo = busNo
+        self.sensorName = sensorName
+        self.sensorModel = sensorModel
+        self.conditioning = conditioning
+        self.addr = addr
+
+        self.bus = None
+        self.i2cTransceiver = None
+        self.breaker = CircuitBreaker(sensorName)
+
+    def is_open(self):
+        return self.bus is not None
+
+    def open(self):
+        if self.sensorModel != None: # SGP4X
+            bus, i2cTransceiver = self.sensor.init(self.busNo, self.sensorName, sensorModel = self.sensorModel, conditioning = self.conditioning,
+                                                   i2cTransceiver = busAccess.open_transceiver(self.busNo))
+        elif self.addr != None: # SHT
+            bus, i2cTransceiver = self.sensor.init(self.busNo, self.sensorName, addr = self.addr,
+                                                   i2cTransceiver = busAccess.open_transceiver(self.busNo))
+        else: # CO2, PM, BAT
+            bus, i2cTransceiver = busAccess.open_smbus(self.busNo), None
+            try:
+                bus = self.sensor.init(self.busNo, bus = bus)
+            except Exception:
+                bus.close()
+                raise
+
+        if bus == -1:
+            raise IOError(f'{self.sensorName} not found on bus {self.busNo}')
+
+        self.bus = bus
+        self.i2cTransceiver = i2cTransceiver
+        print(f'{self.sensorName} initialized successfully.')
+
+    def close(self):
+        handle = self.i2cTransceiver if self.i2cTransceiver != None else self.bus
+        self.bus = None
+        self.i2cTransceiver = None
+        if handle != None:
+            try:
+                handle.close()
+            except Exception:
+                pass
+
+    def suspend(self):
+        """
+        Put the sensor into its low-power state with the driver's stop(),
+        if it has one, e.g. the PM2008 fan or the SGP4x hotplate off, and
+        close the session. The next read re-initialises the sensor.
+        """
+        if self.is_open() and hasattr(self.sensor, 'stop'):
+            try:
+                self.sensor.stop(self.bus)
+            except Exception as e:
+                print(f'Error stopping {self.sensorName}: {e}')
+        self.close()
+
+    def read(self, temperature = None, humidity = None):
+        """
+        Read the sensor, opening the session first if needed.
+
+        Returns:
+        The driver's read() result, or -999 if the sensor could not be
+        initialised or read or its circuit breaker is open. The session is
+        closed on error so the next call re-initialises the sensor.
+        """
+        if not self.breaker.allow():
+            return -999
+
+        if not self.is_open():
+            try:
+                self.open()
+            except Exception as e:
+                print(f'Error initializing {self.sensorName}: {e}')
+                self.close()
+                self.breaker.record_failure()
+                return -999
+
+        try:
+            if self.sensorModel != None: # SGP
+                data = self.sensor.read(self.bus, i2cTransceiver = self.i2cTransceiver, sensorModel = self.sensorModel, temperature = temperature, humidity = humidity)
+            elif self.i2cTransceiver != None: # SHT
+                data = self.sensor.read(self.bus, i2cTransceiver = self.i2cTransceiver)
+            else: # CO2, PM, BAT
+                data = self.sensor.read(self.bus)
+        except Exception as e:
+            print(f'Error reading {self.sensorName}: {e}')
+            self.close()
+            self.breaker.record_failure()
+            return -999
+
+        if read_failed(data):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return data
@@ -1,11 +1,21 @@
 #!/usr/bin/python
+import time
 import drivers.driver_co2 as sensorCO2
 import drivers.driver_pm as sensorPM2008
 import drivers.driver_sht as sensorRHT
 import drivers.driver_sgp4x as sensorTVOC2
 import drivers.driver_adcs as sensorADCs
 import batteryController
+import busAccess
 from functionAQI import getQuality
+from sensorSession import SensorSession
+from samplingEngine import SamplingEngine
+from sensorScheduler import SensorScheduler, SchedulerJob, LatestValueCache, DEFAULT_INTERVALS
+from sensorInventory import SensorInventory
+from sensorReading import SensorReading, FIELD_NAMES, FIELD_INDEX, PM2008_FIELDS
+from sensorFilters import FilterStage
+from singleFlight import SingleFlight
+from powerPolicy import default_modes
 
 busNR_CM1107 = 0
 busNR_PM2008 = 0
@@ -13,6 +23,32 @@ busNR_RHT = 0
 busNR_TVOC = 0
 busNR_BAT = 0
 
+# I2C bus number per sensor name, overridden per board by the
+# "sensorBuses" device setting. Sensors on different buses are sampled
+# in parallel, sensors sharing a bus take turns on it.
+DEFAULT_TOPOLOGY = {
+    'CM1107': busNR_CM1107,
+    'PM2008': busNR_PM2008,
+    'SHT30': busNR_RHT,
+    'SHT40': busNR_RHT,
+    'SGP41': busNR_TVOC,
+    'Battery': busNR_BAT,
+}
+
+# Seconds a battery read is shared with later callers
+BATTERY_MAX_AGE = 5
+
+# Cache entry each reading field is built from
+FIELD_SOURCES = dict({
+    'co2': 'CM1107',
+    'temperature': 'SHT30',
+    'humidity': 'SHT30',
+    'voc': 'SGP41',
+    'nox': 'SGP41',
+    'battery_level': 'Battery',
+    'battery_status': 'Battery',
+}, **{FIELD_NAMES[index]: 'PM2008' for index, key in PM2008_FIELDS})
+
 # Define I2C address constants for RHT sensors
 SHT40_BD1B_ADDR = 0x45 # SHT40-BD1B base RH&T accur., 0x45 I2C addr., c-Air Sensor Baseboard onboard RHT sensor
 Z7N904R_SHT30_ADDR = 0x44 # Z7N904R SHT30 Module, c-Air external RHT Sensor
@@ -23,218 +59,289 @@ adcPATH_NH3 = '/sys/bus/iio/devices/iio:device0/in_voltage6_raw'
 adcPATH_NO2 = '/sys/bus/iio/devices/iio:device0/in_voltage8_raw'
 
 
+def valid_or_none(value):
+    return None if value == -999 else value
+
+
 class SensorHandler:
-    def __init__(self):
-        self.sensorData = {}
+    """
+    Reads all sensors of the board.
+
+    Parameters:
+    hardware (SimulatedHardware): Replaces the I2C buses, e.g. for benchmarks.
+    topology (dict): I2C bus number per sensor name, overrides DEFAULT_TOPOLOGY.
+    filters (dict): Filter chain per field name, sensorFilters.default_filters() if None.
+    battery_max_age (float): Seconds a battery read is served to later callers.
+    """
+
+    def __init__(self, hardware = None, topology = None, filters = None, battery_max_age = BATTERY_MAX_AGE):
+        # Simulated hardware replaces the I2C buses, e.g. for benchmarks
+        if hardware is not None:
+            busAccess.use_hardware(hardware)
+
+        unknown = set(topology or {}) - set(DEFAULT_TOPOLOGY)
+        if unknown:
+            raise ValueError(f'Unknown sensors in topology: {sorted(unknown)}')
+        self.topology = dict(DEFAULT_TOPOLOGY, **(topology or {}))
+
         self.batData = {}
-        self.__is_battery_controller_busy = False
-        
-    def init_sensor(self, sensor, busNo, sensorName, sensorModel = None, conditioning = False, addr = None):
-        if sensorModel != None: # SGP4X
-            sensorBus, i2cTransceiver = sensor.init(busNo, sensorName, sensorModel = sensorModel, conditioning = conditioning)
-            return sensorBus, i2cTransceiver
-                
-        elif addr != None: # SHT
-            sensorBus, i2cTransceiver = sensor.init(busNo, sensorName, addr = addr)
-            return sensorBus, i2cTransceiver
-        
-        else: # CO2, PM, BAT
-            try:
-                sensorBus = sensor.init(busNo)
-                print(f'{sensorName} initialized successfully.')
-                return sensorBus
-            except Exception as e:
-                print(f'Error initializing {sensorName}: {e}')
-                return -1
-   
-    def read_sensor(self, sensor, sensorBus, sensorName, i2cTransceiver = None, sensorModel = None, temp = None, hum = None):    
-        if i2cTransceiver != None and sensorModel != None: # SGP
-            try:
-                data = sensor.read(sensorBus, i2cTransceiver = i2cTransceiver , sensorModel = sensorModel, temperature = temp, humidity = hum) 
-                return data
-            except Exception as e:
-                i2cTransceiver.close()
-                print(f'Error reading {sensorName}: {e}')
-                return -999
-                
-        elif i2cTransceiver != None and sensorModel == None: # SHT
-            try:
-                data = sensor.read(sensorBus, i2cTransceiver = i2cTransceiver)                          
-                return data
-            except Exception as e:
-                i2cTransceiver.close()
-                print(f'Error reading {sensorName}: {e}')
-                return -999
-                
-        else: # CO2, PM, BAT
-            try:
-                data = sensor.read(sensorBus)
-                return data
-            except Exception as e:
-                sensorBus.close()
-                print(f'Error reading {sensorName}: {e}')
-                return -999
-                
+
+        # Sessions keep each sensor's bus open across handler() calls
+        self.sessionCM1107 = SensorSession(sensorCO2, self.topology['CM1107'], 'CM1107')
+        self.sessionPM2008 = SensorSession(sensorPM2008, self.topology['PM2008'], 'PM2008')
+        self.sessionRHText = SensorSession(sensorRHT, self.topology['SHT30'], 'SHT30', addr = Z7N904R_SHT30_ADDR)
+        self.sessionRHT = SensorSession(sensorRHT, self.topology['SHT40'], 'SHT40', addr = SHT40_BD1B_ADDR)
+        self.sessionTVOC = SensorSession(sensorTVOC2, self.topology['SGP41'], 'SGP41', sensorModel = 'SGP41', conditioning = False)
+        self.sessionBAT = SensorSession(batteryController, self.topology['Battery'], 'Battery')
+
+        # Concurrent battery reads share one read, failed reads are not cached
+        self.battery = SingleFlight(lambda: self.read_session(self.sessionBAT), battery_max_age,
+                                    cacheable = lambda result: result != -999)
+
+        # At least one worker per sensor, so every bus always has one
+        self.engine = SamplingEngine(max_workers = len(self.sessions()))
+        self.cache = LatestValueCache()
+        # Outlier rejection and smoothing of the readings handed out
+        self.filters = FilterStage(filters)
+        self.scheduler = None
+        self.intervals = None
+        # Sampling intervals are stretched and sensors skipped by the power mode
+        self.power_mode = default_modes()['normal']
+
+        # Sensors that do not answer at start-up are never read
+        self.inventory = SensorInventory({session.sensorName: session.busNo for session in self.sessions()})
+        self.inventory.scan()
+
+    def sessions(self):
+        return [self.sessionCM1107, self.sessionPM2008, self.sessionRHText,
+                self.sessionRHT, self.sessionTVOC, self.sessionBAT]
+
+    def refresh_inventory(self):
+        """
+        Probe the sensors again and restart the scheduler, if it is
+        running, so that it only samples the sensors found now.
+        """
+        present = self.inventory.scan()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+            self.start_scheduler(self.intervals)
+        return present
+
+    def is_sampled(self, sensorName):
+        return self.inventory.is_present(sensorName) and sensorName not in self.power_mode.skip
+
+    def set_power_mode(self, mode):
+        """
+        Apply a powerPolicy.PowerMode: the sensors it skips are put into
+        their low-power state and read as invalid, and the scheduler, if
+        it is running, is restarted with the intervals scaled by the mode.
+        """
+        running = self.scheduler is not None
+        if running:
+            self.scheduler.stop()
+            self.scheduler = None
+        self.power_mode = mode
+        for session in self.sessions():
+            if session.sensorName in mode.skip:
+                session.suspend()
+                self.cache.update(session.sensorName, -999)
+        if running:
+            self.start_scheduler(self.intervals)
+
+    def read_session(self, session, **kwargs):
+        if not self.is_sampled(session.sensorName):
+            return -999
+        return session.read(**kwargs)
+
+    def submit(self, session, **kwargs):
+        if not self.is_sampled(session.sensorName):
+            return self.engine.resolved(-999)
+        return self.engine.submit(session, **kwargs)
+
+    def co2_status(self):
+        """
+        Returns:
+        dict: Status bits of the last CM1107 result (preheating, drift, light_aging, ...), empty if none.
+        """
+        stream = self.sessionCM1107.bus
+        return dict(stream.status) if stream is not None else {}
+
+    def breaker_status(self):
+        """
+        Returns:
+        dict: Circuit breaker status per sensor name.
+        """
+        return {session.sensorName: session.breaker.status() for session in self.sessions()}
+
+    def degraded_sensors(self):
+        return [name for name, status in self.breaker_status().items() if status['state'] != 'closed']
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        self.engine.shutdown()
+        for session in self.sessions():
+            session.close()
+
+    def voc_compensation(self, dataRHT_internal, dataRHT):
+        """
+        Select the temperature and humidity used to compensate the SGP41:
+        onboard SHT40 first, then the external SHT30, then defaults.
+        """
+        if dataRHT_internal != -999:
+            temp_voc, hum_voc = dataRHT_internal[0], dataRHT_internal[1]
+            print("Temp on board: %f", temp_voc)
+            print("Hum on board: %f", hum_voc)
+            print("Temperature and humidity data for voc are obtained from onboard sensors")
+        elif dataRHT != -999:
+            temp_voc, hum_voc = dataRHT[0], dataRHT[1]
+            print("Temp external: %f", temp_voc)
+            print("Hum external: %f", hum_voc)
+            print("Temperature and humidity data for voc are obtained from external sensors")
+        else:
+            temp_voc, hum_voc = 25, 50
+            print("Temp external: %f", temp_voc)
+            print("Hum external: %f", hum_voc)
+            print("Temperature and humidity data for voc are set to default values")
+        return temp_voc, hum_voc
+
+    def read_battery(self, max_age = None):
+        return self.battery.get(max_age)
+
+    def fill_sensor_data(self, dataCO2, dataPM2008, dataRHT, dataSGP4x, resp_read_battery, timestamp = None):
+        """
+        Build the SensorReading of a cycle from the driver results, -999
+        results become invalid fields. The reading is stamped with
+        timestamp, now if None.
+        """
+        values = [None] * len(FIELD_NAMES)
+
+        if resp_read_battery != -999:
+            dataBAT, dataBATState = resp_read_battery[0], resp_read_battery[1]
+            print('dataBAT: %s',dataBAT)
+            print('dataBATState: %s',dataBATState)
+            values[FIELD_INDEX['battery_level']] = valid_or_none(dataBAT)
+            values[FIELD_INDEX['battery_status']] = valid_or_none(dataBATState)
+
+        if dataCO2 != -999:
+            values[FIELD_INDEX['co2']] = dataCO2
+
+        if dataRHT != -999:
+            values[FIELD_INDEX['temperature']] = valid_or_none(dataRHT[0])
+            values[FIELD_INDEX['humidity']] = valid_or_none(dataRHT[1])
+
+        if dataSGP4x != -999:
+            values[FIELD_INDEX['voc']] = valid_or_none(dataSGP4x[0])
+            values[FIELD_INDEX['nox']] = valid_or_none(dataSGP4x[1])
+
+        if dataPM2008 != -999:
+            for index, key in PM2008_FIELDS:
+                values[index] = valid_or_none(dataPM2008[key])
+
+        return SensorReading(values, timestamp)
+
     def handler(self):
-    
-        dataCO2 = -999
-        dataPM2008 = -999
-        dataRHT = -999
-        dataSGP4x = -999
-        dataRHT_External_Hum = -999
-        dataRHT_External_Temp = -999
-        dataTVOC_VOC = -999
-        dataCO = -999
-        dataNH3 = -999
-        dataNO2 = -999
-        
-        self.sensorData['CAIRRHTLEVEL_EXTERNAL_TEMP'] = -999
-        self.sensorData['CAIRRHTLEVEL_EXTERNAL_HUM'] = -999
-        
-        self.sensorData['CAIRTVOCLEVEL'] = -999
-        self.sensorData['CAIRNO2LEVEL'] = -999
-            
-        self.sensorData["CAIRPM2008_1.0_TSI_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_2.5_TSI_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_10_TSI_LEVEL"] = -999
-        
-        # unused pm2008 data
-        self.sensorData["CAIRPM2008_0.3_L_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_0.5_L_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_1.0_GRIMM_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_1.0_L_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_2.5_GRIMM_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_2.5_L_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_5_L_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_10_GRIMM_LEVEL"] = -999
-        self.sensorData["CAIRPM2008_10_L_LEVEL"] = -999
-
-        self.sensorData["CAIRCOLEVEL"] = -999
-        
-        dataBAT = -999
-        dataBATState = -999
-        
+        # Start all independent reads, the SGP41 waits for the RHT values below.
+        # Reads on different buses run in parallel, the reading is stamped
+        # with the start of the cycle.
+        timestamp = time.time()
+        futureCO2 = self.submit(self.sessionCM1107)
+        futurePM2008 = self.submit(self.sessionPM2008)
+        futureRHT = self.submit(self.sessionRHText)
+        futureRHT_internal = self.submit(self.sessionRHT)
+        futureBAT = self.engine.call(self.read_battery)
+
+        # RHT
+        dataRHT = futureRHT.result()
+        print('dataRHT: %s',dataRHT)
+
+        # RHT + VOC
+        temp_voc, hum_voc = self.voc_compensation(futureRHT_internal.result(), dataRHT)
+        futureSGP4x = self.submit(self.sessionTVOC, temperature = temp_voc, humidity = hum_voc)
+
         # CO2
-        self.busCM1107 = self.init_sensor(sensorCO2, busNR_CM1107 , 'CM1107')
-        if self.busCM1107 != -1:
-            dataCO2 = self.read_sensor(sensorCO2, self.busCM1107, 'CM1107')
-            print('dataCO2: %s',dataCO2)
+        dataCO2 = futureCO2.result()
+        print('dataCO2: %s',dataCO2)
 
-            
         # PM
-        self.busPM2008 = self.init_sensor(sensorPM2008, busNR_PM2008, 'PM2008') 
-        if self.busPM2008 != -1:
-            dataPM2008 = self.read_sensor(sensorPM2008, self.busPM2008, 'PM2008')
-            print('dataPM2008: %s',dataPM2008)
-      
+        dataPM2008 = futurePM2008.result()
+        print('dataPM2008: %s',dataPM2008)
 
-        # RHT
-        self.busRHText, self.i2cTransceiver_sht = self.init_sensor(sensorRHT, busNR_RHT, 'SHT30', addr = Z7N904R_SHT30_ADDR) 
-        if self.busRHText != -1 and self.i2cTransceiver_sht != -1:
-            dataRHT = self.read_sensor(sensorRHT, self.busRHText, 'SHT30', i2cTransceiver = self.i2cTransceiver_sht)
-            print('dataRHT: %s',dataRHT)
-        
+        dataSGP4x = futureSGP4x.result()
+        print('dataSGP4x: %s',dataSGP4x)
 
-        # RHT + VOC
-        self.busRHT, self.i2cTransceiver_sht40 = self.init_sensor(sensorRHT, busNR_RHT, 'SHT40', addr = SHT40_BD1B_ADDR) 
-        if self.busRHT != -1 and self.i2cTransceiver_sht40 != -1:
-            dataRHT_internal = self.read_sensor(sensorRHT, self.busRHT, 'SHT40', i2cTransceiver = self.i2cTransceiver_sht40)
-            if dataRHT_internal != -999:
-                temp_voc, hum_voc = dataRHT_internal[0], dataRHT_internal[1]
-                print("Temp on board: %f", temp_voc)
-                print("Hum on board: %f", hum_voc)
-                print("Temperature and humidity data for voc are obtained from onboard sensors")
-            else:
-                if dataRHT != -999:
-                    temp_voc, hum_voc = dataRHT[0], dataRHT[1]
-                    print("Temp external: %f", temp_voc)
-                    print("Hum external: %f", hum_voc)
-                    print("Temperature and humidity data for voc are obtained from external sensors")
-                else:
-                    temp_voc, hum_voc = 25, 50
-                    print("Temp external: %f", temp_voc)
-                    print("Hum external: %f", hum_voc)
-                    print("Temperature and humidity data for voc are set to default values")
-        else:
-            if dataRHT != -999:
-                temp_voc, hum_voc = dataRHT[0], dataRHT[1]
-                print("Temp external: %f", temp_voc)
-                print("Hum external: %f", hum_voc)
-                print("Temperature and humidity data for voc are obtained from external sensors")
-            else:
-                temp_voc, hum_voc = 25, 50
-                print("Temp external: %f", temp_voc)
-                print("Hum external: %f", hum_voc)
-                print("Temperature and humidity data for voc are set to default values")
-        
-        self.busTVOC, self.i2cTransceiver_sgp = self.init_sensor(sensorTVOC2, busNR_TVOC, 'SGP41', sensorModel = 'SGP41', conditioning=False) 
-        if self.busTVOC != -1 and self.i2cTransceiver_sgp != -1:
-            dataSGP4x = self.read_sensor(sensorTVOC2, self.busTVOC, 'SGP41', i2cTransceiver = self.i2cTransceiver_sgp, sensorModel =  'SGP41', temp = temp_voc, hum = hum_voc)
-            print('dataSGP4x: %s',dataSGP4x)
-            
-        
         # Battery
-        while self.__is_battery_controller_busy:
-            pass
-        self.__is_battery_controller_busy = True
-        self.busBAT = self.init_sensor(batteryController, busNR_BAT, 'Battery')
-        if self.busBAT != -1:
-            resp_read_battery = self.read_sensor(batteryController, self.busBAT, 'Battery')
-            self.__is_battery_controller_busy = False
-            if resp_read_battery != -999:
-                dataBAT, dataBATState = resp_read_battery[0], resp_read_battery[1]
-                print('dataBAT: %s',dataBAT)
-                print('dataBATState: %s',dataBATState)
-
-
-
-        self.sensorData['CAIRCO2LEVEL'] = dataCO2
-        self.sensorData["STT_BATTERY_LEVEL"] = dataBAT
-        self.sensorData["STT_CAIR_BATTERY_STATUS"] = dataBATState
-        
-        if dataRHT != -999:
-            self.sensorData['CAIRRHTLEVEL_EXTERNAL_TEMP'] = dataRHT[0]
-            self.sensorData['CAIRRHTLEVEL_EXTERNAL_HUM'] = dataRHT[1]
-            
-        if dataSGP4x != -999 :   
-            self.sensorData['CAIRTVOCLEVEL'] = dataSGP4x[0]
-            self.sensorData['CAIRNO2LEVEL'] = dataSGP4x[1]
-          
-        if dataPM2008 != -999:
-            self.sensorData['CAIRPM2008_1.0_TSI_LEVEL'] = dataPM2008['CAIRPM2008_1.0_TSI_LEVEL']
-            self.sensorData['CAIRPM2008_2.5_TSI_LEVEL'] = dataPM2008['CAIRPM2008_2.5_TSI_LEVEL']
-            self.sensorData['CAIRPM2008_10_TSI_LEVEL'] = dataPM2008['CAIRPM2008_10_TSI_LEVEL']
-            
-            self.sensorData['CAIRPM2008_0.3_L_LEVEL'] = dataPM2008['CAIRPM2008_0.3_L_LEVEL']
-            self.sensorData['CAIRPM2008_0.5_L_LEVEL'] = dataPM2008['CAIRPM2008_0.5_L_LEVEL'] 
-            self.sensorData['CAIRPM2008_1.0_GRIMM_LEVEL'] = dataPM2008['CAIRPM2008_1.0_GRIMM_LEVEL']
-            self.sensorData['CAIRPM2008_1.0_L_LEVEL'] = dataPM2008['CAIRPM2008_1.0_L_LEVEL']
-            self.sensorData['CAIRPM2008_2.5_GRIMM_LEVEL'] = dataPM2008['CAIRPM2008_2.5_GRIMM_LEVEL']
-            self.sensorData['CAIRPM2008_2.5_L_LEVEL'] = dataPM2008['CAIRPM2008_2.5_L_LEVEL']
-            self.sensorData['CAIRPM2008_5_L_LEVEL'] = dataPM2008['CAIRPM2008_5_L_LEVEL']
-            self.sensorData['CAIRPM2008_10_GRIMM_LEVEL'] = dataPM2008['CAIRPM2008_10_GRIMM_LEVEL']
-            self.sensorData['CAIRPM2008_10_L_LEVEL'] = dataPM2008['CAIRPM2008_10_L_LEVEL']
-
-        return self.sensorData 
-    
-    
+        resp_read_battery = futureBAT.result()
+
+        return self.filters.apply(self.fill_sensor_data(dataCO2, dataPM2008, dataRHT, dataSGP4x, resp_read_battery, timestamp))
+
+    def read_rht(self):
+        return self.read_session(self.sessionRHText), self.read_session(self.sessionRHT)
+
+    def read_voc(self):
+        dataRHT = self.cache.get('SHT30')
+        dataRHT_internal = self.cache.get('SHT40')
+        temp_voc, hum_voc = self.voc_compensation(dataRHT_internal, dataRHT)
+        return self.read_session(self.sessionTVOC, temperature = temp_voc, humidity = hum_voc)
+
+    def start_scheduler(self, intervals = None):
+        """
+        Sample every sensor in the background at its own cadence and keep
+        the results in self.cache. Intervals in seconds per job name
+        override DEFAULT_INTERVALS and are scaled by the power mode. Only
+        sensors in the inventory and not skipped by the power mode are
+        scheduled.
+        """
+        self.intervals = intervals
+        intervals = {name: interval * self.power_mode.interval_scale
+                     for name, interval in dict(DEFAULT_INTERVALS, **(intervals or {})).items()}
+        jobs = [
+            SchedulerJob('RHT', intervals['RHT'], self.read_rht, ['SHT30', 'SHT40']),
+            SchedulerJob('SGP41', intervals['SGP41'], self.read_voc),
+            SchedulerJob('CM1107', intervals['CM1107'], self.sessionCM1107.read),
+            SchedulerJob('PM2008', intervals['PM2008'], self.sessionPM2008.read),
+            SchedulerJob('Battery', intervals['Battery'], self.read_battery),
+        ]
+        jobs = [job for job in jobs if any(self.is_sampled(name) for name in (job.cache_names or [job.name]))]
+        self.scheduler = SensorScheduler(self.engine, jobs, self.cache)
+        self.scheduler.start()
+
+    def wait_for_samples(self, timeout = None):
+        """
+        Wait until the scheduler has sampled every sensor once, so the
+        first cached reading is not empty.
+
+        Returns:
+        bool: False if the timeout expired first.
+        """
+        if self.scheduler is None:
+            return True
+        return self.scheduler.wait_sampled(timeout)
+
+    def cached_sensor_data(self):
+        """
+        Build the SensorReading from the latest cached values without
+        touching the bus. Sensors that have not been sampled yet are invalid.
+        The reading is stamped with the time of its newest sample. Each
+        sample goes through the filters once, however often it is read.
+        """
+        entries = {name: self.cache.get_entry(name) for name in ('CM1107', 'PM2008', 'SHT30', 'SGP41', 'Battery')}
+        sampled = [sampleTime for value, sampleTime in entries.values() if sampleTime is not None]
+        reading = self.fill_sensor_data(entries['CM1107'][0], entries['PM2008'][0], entries['SHT30'][0],
+                                        entries['SGP41'][0], entries['Battery'][0], max(sampled) if sampled else None)
+        return self.filters.apply(reading, {name: entries[source][1] for name, source in FIELD_SOURCES.items()})
+
     def read_battery_controller(self): 
         # Battery
         dataBAT = -999
         dataBATState = -999
-        import time
-        
-        while self.__is_battery_controller_busy:
-            time.sleep(0.1)  # Sleep briefly to release the CPU
-        self.__is_battery_controller_busy = True
-        self.busBAT = self.init_sensor(batteryController, busNR_BAT, 'Battery')
-        if self.busBAT != -1:
-            resp_read_battery = self.read_sensor(batteryController, self.busBAT, 'Battery')
-            self.__is_battery_controller_busy = False
-            if resp_read_battery != -999:
-                dataBAT, dataBATState = resp_read_battery[0], resp_read_battery[1]
-                print('dataBAT: %s',dataBAT)
-                print('dataBATState: %s',dataBATState)
+
+        resp_read_battery = self.read_battery()
+        if resp_read_battery != -999:
+            dataBAT, dataBATState = resp_read_battery[0], resp_read_battery[1]
+            print('dataBAT: %s',dataBAT)
+            print('dataBATState: %s',dataBATState)
         
         self.batData['STT_BATTERY_LEVEL'] = dataBAT
         self.batData['STT_CAIR_BATTERY_STATUS'] = dataBATState        
@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import errno
+import ctypes
+import struct
+import random
+import argparse
+import tempfile
+import threading
+
+# Simulated I2C clock, every transferred byte takes 9 clock cycles
+BUS_CLOCK = 100000
+
+# Status codes of the sensirion-i2c-driver transceiver API
+STATUS_OK = 0
+STATUS_NACK = 2
+
+
+def crc8(data):
+    """
+    Sensirion CRC-8: polynomial 0x31, initialisation 0xFF.
+    """
+    crc = 0xFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+def sensirion_words(*words):
+    data = []
+    for word in words:
+        msb, lsb = (word >> 8) & 0xFF, word & 0xFF
+        data += [msb, lsb, crc8([msb, lsb])]
+    return data
+
+def nack(addr):
+    return OSError(errno.EREMOTEIO, 'Remote I/O error (NACK from 0x{:02X})'.format(addr))
+
+
+class SimulatedDevice:
+    """
+    Base class of the chip models. write() receives the bytes of a write
+    transfer, read() returns the bytes of a read transfer; both raise
+    OSError for a NACK like the Linux I2C drivers do.
+    """
+    address = None
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def write(self, data):
+        raise nack(self.address)
+
+    def read(self, length):
+        raise nack(self.address)
+
+    def drift(self, value, step, lower, upper):
+        return min(max(value + self.rng.gauss(0, step), lower), upper)
+
+
+class CM1107Model(SimulatedDevice):
+    """
+    Cubic CM1107 CO2 sensor: a command byte selects the frame that every
+    following read returns, [cmd][DF0..DFn][CS] with CS = -(sum) & 0xFF.
+    """
+    address = 0x31
+
+    def __init__(self, rng, co2 = 800, status = 0x00):
+        super().__init__(rng)
+        self.co2 = co2
+        self.status = status
+        self.serial = [1234, 5678, 9012, 3456, 7890]
+        self.command = None
+
+    def frame(self):
+        if self.command == 0x01:
+            self.co2 = int(self.drift(self.co2, 5, 400, 5000))
+            data = [0x01, self.co2 >> 8, self.co2 & 0xFF, self.status]
+        elif self.command == 0x1F:
+            data = [0x1F]
+            for word in self.serial:
+                data += [word >> 8, word & 0xFF]
+        elif self.command == 0x1E:
+            data = [0x1E] + list(b'V1.0.SIM  ')
+        else:
+            # No command yet, e.g. the read byte of an address probe
+            return [0x00]
+        return data + [-sum(data) & 0xFF]
+
+    def write(self, data):
+        self.command = data[0]
+
+    def read(self, length):
+        frame = self.frame()
+        return (frame + [0] * length)[:length]
+
+
+class PM2008Model(SimulatedDevice):
+    """
+    Cubic PM2008 particle sensor: 7-byte command frames with XOR check
+    code, 32-byte data frames with the same check code in P32.
+    """
+    address = 0x28
+
+    def __init__(self, rng, pm2_5 = 12):
+        super().__init__(rng)
+        self.pm2_5 = pm2_5
+        self.status = 1 # closed
+        self.mode = 0
+
+    def write(self, data):
+        if len(data) != 7 or data[0] != 0x16 or data[1] != 7:
+            return # register pointer write of a read, ignored
+        check = 0
+        for byte in data[:6]:
+            check ^= byte
+        if check != data[6]:
+            raise nack(self.address)
+        control, period = data[2], (data[3] << 8) | data[4]
+        if control == 1:   # close measurement
+            self.status = 1
+        elif control == 4: # timing mode, P4/P5 is the measuring period
+            self.status = 0x80
+            self.mode = max(period, 60)
+        elif control in (2, 3, 5):
+            self.status = 0x80 if control == 5 else 2
+            self.mode = control
+
+    def read(self, length):
+        self.pm2_5 = self.drift(self.pm2_5, 0.5, 0, 500)
+        pm = self.pm2_5
+        values = [self.mode, 100,                                   # mode, calibration coefficient
+                  int(pm * 0.7), int(pm), int(pm * 1.4),            # GRIMM
+                  int(pm * 0.7), int(pm), int(pm * 1.4),            # TSI
+                  int(pm * 150), int(pm * 45), int(pm * 8), int(pm * 2), int(pm * 0.4), int(pm * 0.1)]
+        frame = [0x16, 32, self.status]
+        for value in values:
+            frame += [(value >> 8) & 0xFF, value & 0xFF]
+        check = 0
+        for byte in frame:
+            check ^= byte
+        frame.append(check)
+        return (frame + [0] * length)[:length]
+
+
+class ShtModel(SimulatedDevice):
+    """
+    Sensirion SHT3x (16 bit commands) or SHT4x (8 bit commands). A
+    measurement command starts a conversion; reading before it is done
+    is NACKed. Results are CRC protected words.
+    """
+    SHT3X_MEASURE = {0x2400: 0.0155, 0x240B: 0.0065, 0x2416: 0.0045, 0x2C06: 0.0155, 0x2C0D: 0.0065, 0x2C10: 0.0045}
+    SHT4X_MEASURE = {0xFD: 0.0083, 0xF6: 0.0045, 0xE0: 0.0017}
+
+    def __init__(self, rng, address, model, temperature = 24.0, humidity = 45.0):
+        super().__init__(rng)
+        self.address = address
+        self.model = model
+        self.temperature = temperature
+        self.humidity = humidity
+        self.response = None
+        self.readyAt = 0
+
+    def write(self, data):
+        if self.model == 'SHT3x':
+            command = (data[0] << 8) | data[1] if len(data) >= 2 else None
+            measure, serial, reset = self.SHT3X_MEASURE, 0x3780, 0x30A2
+        else:
+            command = data[0]
+            measure, serial, reset = self.SHT4X_MEASURE, 0x89, 0x94
+
+        if command in measure:
+            self.temperature = self.drift(self.temperature, 0.05, -40, 125)
+            self.humidity = self.drift(self.humidity, 0.2, 0, 100)
+            ticksT = int((self.temperature + 45) * 65535 / 175)
+            if self.model == 'SHT3x':
+                ticksRH = int(self.humidity * 65535 / 100)
+            else:
+                ticksRH = int((self.humidity + 6) * 65535 / 125)
+            self.response = sensirion_words(ticksT, ticksRH)
+            self.readyAt = time.monotonic() + measure[command]
+        elif command == serial:
+            self.response = sensirion_words(0x1234, 0x5678)
+            self.readyAt = time.monotonic() + 0.001
+        elif command == reset:
+            self.response = None
+        else:
+            raise nack(self.address)
+
+    def read(self, length):
+        if self.response is None or time.monotonic() < self.readyAt:
+            raise nack(self.address)
+        response, self.response = self.response, None
+        return response[:length]
+
+
+class Sgp4xModel(SimulatedDevice):
+    """
+    Sensirion SGP40/SGP41: 16 bit commands with CRC protected arguments,
+    conversions NACK reads until they are done.
+    """
+    address = 0x59
+
+    def __init__(self, rng, model = 'SGP41', rawVoc = 30000, rawNox = 15000):
+        super().__init__(rng)
+        self.model = model
+        self.rawVoc = rawVoc
+        self.rawNox = rawNox
+        self.response = None
+        self.readyAt = 0
+
+    def write(self, data):
+        if len(data) < 2:
+            raise nack(self.address)
+        command, args = (data[0] << 8) | data[1], data[2:]
+        for i in range(0, len(args) - 2, 3):
+            if crc8(args[i:i + 2]) != args[i + 2]:
+                raise nack(self.address)
+
+        self.rawVoc = int(self.drift(self.rawVoc, 50, 0, 65535))
+        self.rawNox = int(self.drift(self.rawNox, 20, 0, 65535))
+        if command == 0x3682:   # get serial number
+            response, duration = sensirion_words(0x0000, 0x0123, 0x4567), 0.001
+        elif command == 0x260F and self.model == 'SGP40':  # measure raw signal
+            response, duration = sensirion_words(self.rawVoc), 0.030
+        elif command == 0x2619 and self.model == 'SGP41':  # measure raw signals
+            response, duration = sensirion_words(self.rawVoc, self.rawNox), 0.050
+        elif command == 0x2612 and self.model == 'SGP41':  # conditioning
+            response, duration = sensirion_words(self.rawVoc), 0.050
+        elif command == 0x280E: # execute self test
+            response, duration = sensirion_words(0xD400), 0.320
+        elif command == 0x3615: # turn heater off
+            response, duration = None, 0.001
+        else:
+            raise nack(self.address)
+        self.response = response
+        self.readyAt = time.monotonic() + duration
+
+    def read(self, length):
+        if self.response is None or time.monotonic() < self.readyAt:
+            raise nack(self.address)
+        response, self.response = self.response, None
+        return response[:length]
+
+
+class BQ25887Model(SimulatedDevice):
+    """
+    TI BQ25887 charger register file. A write sets the register pointer
+    (and writes the following bytes), reads auto-increment. Status, flag
+    and ADC registers are read-only, flag registers REG0F-REG11 clear on
+    read and the ADC result registers only update while ADC_EN is set.
+    With ADC_RATE set a read ends the one-shot conversion and clears ADC_EN.
+    """
+    address = 0x6A
+    READ_ONLY = set(range(0x0B, 0x12)) | set(range(0x17, 0x26))
+    CLEAR_ON_READ = {0x0F, 0x10, 0x11}
+
+    def __init__(self, rng, vbat = 7800, chargeStatus = 3, vbusStatus = 3):
+        super().__init__(rng)
+        self.vbat = vbat
+        self.regs = [0] * 0x30
+        self.regs[0x00] = 0xA0 # VCELLREG 4.2 V
+        self.regs[0x05] = 0x9D
+        self.regs[0x06] = 0x7D # EN_CHG
+        self.regs[0x0B] = chargeStatus & 0x07
+        self.regs[0x0C] = 0x80 | ((vbusStatus & 0x07) << 4) # PG_STAT
+        self.regs[0x25] = 0x2C # part information
+        self.regs[0x2A] = 0x40 # CB_AUTO_EN
+        self.pointer = 0
+
+    def write(self, data):
+        self.pointer = data[0]
+        for value in data[1:]:
+            if self.pointer not in self.READ_ONLY:
+                self.regs[self.pointer] = value & 0xFF
+            self.pointer = (self.pointer + 1) % len(self.regs)
+
+    def read(self, length):
+        if self.regs[0x15] & 0x80: # ADC_EN
+            self.vbat = int(self.drift(self.vbat, 2, 6000, 8600))
+            self.regs[0x1D], self.regs[0x1E] = self.vbat >> 8, self.vbat & 0xFF
+            if self.regs[0x15] & 0x40: # ADC_RATE one-shot
+                self.regs[0x15] &= ~0x80
+        data = []
+        for _ in range(length):
+            data.append(self.regs[self.pointer])
+            if self.pointer in self.CLEAR_ON_READ:
+                self.regs[self.pointer] = 0
+            self.pointer = (self.pointer + 1) % len(self.regs)
+        return data
+
+    def raise_flag(self, register, bit):
+        self.regs[register] |= 1 << bit
+
+
+class SimulatedI2cBus:
+    """
+    One I2C bus with chip models attached. Every transfer takes the time
+    it would take on the wire at busClock Hz (0 disables the delay) and is
+    counted in transfers.
+    """
+
+    def __init__(self, busNo, devices, busClock = BUS_CLOCK):
+        self.busNo = busNo
+        self.devices = {device.address: device for device in devices}
+        self.busClock = busClock
+        self.transfers = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def transfer(self, addr, write = None, readLength = 0):
+        length = 1 + (len(write) if write else 0) + readLength
+        if self.busClock:
+            time.sleep(length * 9 / self.busClock)
+        with self.lock:
+            self.transfers += 1
+            self.bytes += length
+            device = self.devices.get(addr)
+            if device is None:
+                raise nack(addr)
+            if write:
+                device.write(list(write))
+            if readLength:
+                return device.read(readLength)
+            return []
+
+
+class SimulatedSMBus:
+    """
+    smbus.SMBus API on a SimulatedI2cBus.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    def write_quick(self, addr):
+        self.bus.transfer(addr)
+
+    def read_byte(self, addr):
+        return self.bus.transfer(addr, readLength = 1)[0]
+
+    def write_byte(self, addr, value):
+        self.bus.transfer(addr, write = [value])
+
+    def read_byte_data(self, addr, register):
+        self.bus.transfer(addr, write = [register])
+        return self.bus.transfer(addr, readLength = 1)[0]
+
+    def write_byte_data(self, addr, register, value):
+        self.bus.transfer(addr, write = [register, value])
+
+    def read_i2c_block_data(self, addr, register, length = 32):
+        self.bus.transfer(addr, write = [register])
+        return self.bus.transfer(addr, readLength = length)
+
+    def write_i2c_block_data(self, addr, register, data):
+        self.bus.transfer(addr, write = [register] + list(data))
+
+    def i2c_rdwr(self, *msgs):
+        # smbus2 i2c_msg objects, a write followed by a read is one transfer with a repeated start
+        pending = None
+        for msg in msgs:
+            if msg.flags & 0x0001: # I2C_M_RD
+                data = self.bus.transfer(msg.addr, write = pending, readLength = msg.len)
+                ctypes.memmove(msg.buf, bytes(data), msg.len)
+                pending = None
+            else:
+                if pending is not None:
+                    self.bus.transfer(msg.addr, write = pending)
+                pending = list(msg)
+        if pending is not None:
+            self.bus.transfer(msgs[-1].addr, write = pending)
+
+    def close(self):
+        pass
+
+
+class SimulatedI2cTransceiver:
+    """
+    sensirion-i2c-driver transceiver (API version 1) on a SimulatedI2cBus.
+    """
+    API_VERSION = 1
+    STATUS_OK = STATUS_OK
+    STATUS_NACK = STATUS_NACK
+
+    def __init__(self, bus):
+        self.bus = bus
+
+    @property
+    def description(self):
+        return 'simulated I2C bus {}'.format(self.bus.busNo)
+
+    @property
+    def channel_count(self):
+        return None
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def transceive(self, slave_address, tx_data, rx_length, read_delay, timeout):
+        try:
+            if tx_data:
+                self.bus.transfer(slave_address, write = tx_data)
+            if not rx_length:
+                return STATUS_OK, None, bytes()
+            if tx_data and read_delay > 0:
+                time.sleep(read_delay)
+            return STATUS_OK, None, bytes(self.bus.transfer(slave_address, readLength = rx_length))
+        except OSError as e:
+            return STATUS_NACK, e, None
+
+
+class SimulatedIio:
+    """
+    sysfs IIO device with the raw ADC files of the MICS-6814 channels and
+    the scan elements and buffer attributes of a 12 bit ADC, created under
+    a temporary folder. devPath stands in for /dev/iio:device0: when the
+    buffer is enabled, capture() appends scans of the enabled elements
+    to it, laid out like the kernel does.
+    """
+    CHANNELS = {0: 1500, 6: 2200, 8: 900} # CO, NH3, NO2 raw values
+    TIMESTAMP_INDEX = 16
+
+    def __init__(self, rng, root = None):
+        self.rng = rng
+        self.root = root if root is not None else tempfile.mkdtemp(prefix = 'iio-')
+        self.device = os.path.join(self.root, 'iio:device0')
+        self.devPath = os.path.join(self.root, 'dev-iio:device0')
+        for folder in ('scan_elements', 'buffer', 'trigger'):
+            os.makedirs(os.path.join(self.device, folder), exist_ok = True)
+        self.values = dict(self.CHANNELS)
+        self.update()
+
+        for channel in self.CHANNELS:
+            self.write('scan_elements/in_voltage{}_en'.format(channel), 0)
+            self.write('scan_elements/in_voltage{}_index'.format(channel), channel)
+            self.write('scan_elements/in_voltage{}_type'.format(channel), 'le:u12/16>>0')
+        self.write('scan_elements/in_timestamp_en', 1)
+        self.write('scan_elements/in_timestamp_index', self.TIMESTAMP_INDEX)
+        self.write('scan_elements/in_timestamp_type', 'le:s64/64>>0')
+        self.write('buffer/length', 2)
+        self.write('buffer/enable', 0)
+        self.write('trigger/current_trigger', '')
+        open(self.devPath, 'wb').close()
+
+    def write(self, name, value):
+        with open(os.path.join(self.device, name), 'w') as f:
+            f.write('{}\n'.format(value))
+
+    def read(self, name):
+        with open(os.path.join(self.device, name), 'r') as f:
+            return f.read().strip()
+
+    def path(self, channel):
+        return os.path.join(self.device, 'in_voltage{}_raw'.format(channel))
+
+    def update(self):
+        for channel, value in self.values.items():
+            self.values[channel] = int(min(max(value + self.rng.gauss(0, 10), 1), 4095))
+            with open(self.path(channel), 'w') as f:
+                f.write('{}\n'.format(self.values[channel]))
+
+    def capture(self, samples):
+        if self.read('buffer/enable') != '1':
+            return
+        elements = sorted((channel, 'H') for channel in self.CHANNELS
+                          if self.read('scan_elements/in_voltage{}_en'.format(channel)) == '1')
+        if self.read('scan_elements/in_timestamp_en') == '1':
+            elements.append((self.TIMESTAMP_INDEX, 'q'))
+        # Native alignment of struct gives the kernel scan layout, padded to the largest element
+        align = max([struct.calcsize(fmt) for _, fmt in elements] + [1])
+        scanFormat = '@' + ''.join(fmt for _, fmt in elements) + '0{}'.format('q' if align == 8 else 'H')
+        with open(self.devPath, 'ab') as f:
+            for _ in range(samples):
+                self.update()
+                values = [self.values[index] if fmt == 'H' else time.time_ns() for index, fmt in elements]
+                f.write(struct.pack(scanFormat, *values))
+
+
+class SimulatedHardware:
+    """
+    Board without sensors: every chip of the c-Air board is modelled, on
+    bus 0 unless buses says otherwise, and the ADC channels are plain files. Pass it to
+    busAccess.use_hardware() (or SensorHandler(hardware=...)) to run the
+    sensor stack on any Linux machine.
+
+    Parameters:
+    busClock (int): Simulated I2C clock in Hz, 0 for no transfer delay.
+    seed (int): Seed of the simulated measurement noise.
+    absent (list): Addresses of chips that are not fitted.
+    buses (dict): Bus number per chip address, e.g. for carrier boards with several I2C controllers.
+    dataRoot (str): Folder replacing /home/cairapp for the files the drivers keep, a new temporary folder if None.
+    """
+
+    def __init__(self, busClock = BUS_CLOCK, seed = 0, absent = (), buses = None, dataRoot = None):
+        self.rng = random.Random(seed)
+        self.dataRoot = dataRoot if dataRoot is not None else tempfile.mkdtemp(prefix = 'cairapp-')
+        self.use_data_root()
+        devices = [CM1107Model(self.rng), PM2008Model(self.rng),
+                   ShtModel(self.rng, 0x44, 'SHT3x'), ShtModel(self.rng, 0x45, 'SHT4x'),
+                   Sgp4xModel(self.rng), BQ25887Model(self.rng)]
+        devices = [device for device in devices if device.address not in absent]
+        busNos = {device.address: (buses or {}).get(device.address, 0) for device in devices}
+        self.buses = {busNo: SimulatedI2cBus(busNo, [device for device in devices if busNos[device.address] == busNo], busClock)
+                      for busNo in sorted(set(busNos.values()) | {0})}
+        self.iio = SimulatedIio(self.rng)
+
+    def use_data_root(self):
+        """
+        Point the VOC and NOX history and state files of the SGP4x driver
+        into dataRoot, so a simulation never touches the files of the
+        application.
+        """
+        from drivers import driver_sgp4x
+        for signal in ('voc', 'nox'):
+            folder = os.path.join(self.dataRoot, signal.upper()) + os.sep
+            setattr(driver_sgp4x, signal + 'BufferFolder', folder)
+            setattr(driver_sgp4x, signal + 'BufferFile', folder + signal + 'history.bin')
+            setattr(driver_sgp4x, signal + 'LegacyBufferFile', folder + signal + 'history.csv')
+        driver_sgp4x.vocSnapshotFile = driver_sgp4x.vocBufferFolder + 'vocstate.bin'
+        driver_sgp4x.gas_index_engines.clear()
+
+    def bus(self, busNo):
+        if busNo not in self.buses:
+            raise FileNotFoundError(errno.ENOENT, 'No such file or directory', '/dev/i2c-' + str(busNo))
+        return self.buses[busNo]
+
+    def open_smbus(self, busNo):
+        return SimulatedSMBus(self.bus(busNo))
+
+    def open_transceiver(self, busNo):
+        return SimulatedI2cTransceiver(self.bus(busNo))
+
+    def transfers(self):
+        return sum(bus.transfers for bus in self.buses.values())
+
+
+def main():
+    msg = "Sensor stack benchmark on simulated hardware"
+    parser = argparse.ArgumentParser(description=msg)
+    parser.add_argument("-c", "--cycles", type=int, default=10, required=False, help="number of handler() cycles, default: 10")
+    parser.add_argument("-k", "--bus_clock", type=int, default=BUS_CLOCK, required=False, help="simulated I2C clock in Hz, 0 for none")
+    parser.add_argument("-b", "--buses", type=int, default=1, required=False, help="spread the sensors over this many I2C buses, default: 1")
+    args = parser.parse_args()
+
+    from sensorUtils import SensorHandler
+    from sensorInventory import SENSOR_ADDRESSES
+    from drivers import i2ctransfer
+
+    topology = {name: index % args.buses for index, name in enumerate(SENSOR_ADDRESSES)}
+    hardware = SimulatedHardware(busClock = args.bus_clock, buses = {SENSOR_ADDRESSES[name]: busNo for name, busNo in topology.items()})
+    handler = SensorHandler(hardware = hardware, topology = topology)
+    times = []
+    try:
+        for _ in range(args.cycles):
+            start = time.perf_counter()
+            handler.handler()
+            times.append(time.perf_counter() - start)
+    finally:
+        handler.close()
+
+    print("cycles: {}, mean: {:.3f} s, min: {:.3f} s, max: {:.3f} s, I2C transfers: {}, smbus transactions: {}".format(
+        len(times), sum(times) / len(times), min(times), max(times), hardware.transfers(), i2ctransfer.counter.snapshot()['transactions']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
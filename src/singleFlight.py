@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """
+    Shares one call of a function between concurrent callers and caches
+    its result.
+
+    A caller gets the cached result while it is younger than max_age.
+    Otherwise the first caller runs the function and every caller that
+    arrives meanwhile waits for and gets the same result. If the
+    function raises, all of them get the exception and the next caller
+    runs the function again, so waiters are always released.
+
+    Parameters:
+    function (callable): Function without arguments, e.g. a sensor read.
+    max_age (float): Seconds a result is served from the cache, 0 to only share in-progress calls.
+    cacheable (callable): Decides whether a result is cached, e.g. not the -999 of a failed read. All results are cached if None.
+    """
+
+    def __init__(self, function, max_age = 0, cacheable = None):
+        self.function = function
+        self.max_age = max_age
+        self.cacheable = cacheable
+        self.lock = threading.Lock()
+        self.future = None
+        self.result = None
+        self.resultTime = None
+
+    def get(self, max_age = None):
+        """
+        Parameters:
+        max_age (float): Overrides the max_age of the cache for this call.
+
+        Returns:
+        The cached or shared result of the function.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        with self.lock:
+            if self.resultTime is not None and time.monotonic() - self.resultTime <= max_age:
+                return self.result
+            future = self.future
+            if future is None:
+                self.future = Future()
+        if future is not None:
+            return future.result()
+
+        try:
+            result = self.function()
+        except BaseException as e:
+            with self.lock:
+                future, self.future = self.future, None
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            if self.cacheable is None or self.cacheable(result):
+                self.result = result
+                self.resultTime = time.monotonic()
+            future, self.future = self.future, None
+        future.set_result(result)
+        return result
+
+    def invalidate(self):
+        with self.lock:
+            self.resultTime = None
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import io
+import random
+import batteryController
+from simulatedHardware import BQ25887Model, SimulatedI2cBus, SimulatedSMBus
+
+ADC_EN = 1 << batteryController.ADC_EN_BIT
+
+
+def charger(**kwargs):
+    model = BQ25887Model(random.Random(0), **kwargs)
+    return model, batteryController.init(0, SimulatedSMBus(SimulatedI2cBus(0, [model], 0)))
+
+
+def test_read_leaves_the_adc_off():
+    model, monitor = charger(vbat = 7800)
+    level, status = monitor.read()
+    assert 0 <= level <= 100
+    assert abs(monitor.snapshot.field("VBAT_ADC") - 7800) < 50
+    assert not model.regs[0x15] & ADC_EN
+    monitor.read()
+    assert not model.regs[0x15] & ADC_EN
+
+
+def test_configuration_is_restored_after_a_reset():
+    model, monitor = charger()
+    monitor.read()
+    vcellreg = monitor.vcellreg
+    model.regs[0x00] = 0xA0 # brown-out, VCELLREG back at its default
+    monitor.read()
+    assert model.regs[0x00] == vcellreg != 0xA0
+    model.raise_flag(0x10, 3) # WD_FLAG
+    monitor.read()
+    assert monitor.take_flags()[1] & 1 << 3
+
+
+def test_readall_converts_before_the_dump(capsys):
+    model, monitor = charger(vbat = 7800)
+    snapshot = batteryController.readAll(monitor.bus)
+    assert abs(snapshot.value("VBAT_ADC") - 7800) < 50
+    assert model.regs[0x2A] & 1 << 6 and model.regs[0x03] & 1 << 5
+    assert "Battery Voltage" in capsys.readouterr().out
+
+
+def test_battery_log_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(batteryController, 'wait', lambda seconds: None)
+    model, monitor = charger()
+    path = str(tmp_path / 'BATTERY' / 'batterylog.bin')
+    log = batteryController.open_battery_log(path, capacity = 2)
+    batteryController.log_battery(monitor, log, interval = 0, samples = 3)
+    log.close()
+    csv = io.StringIO()
+    assert batteryController.export_battery_log(csv, path) == 2
+    header, *rows = csv.getvalue().splitlines()
+    assert header.split(',') == list(batteryController.BATTERY_LOG_FIELDS)
+    assert len(rows) == 2
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import circuitBreaker
+from circuitBreaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def breaker(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuitBreaker.time, 'monotonic', clock.monotonic)
+    return CircuitBreaker('test', failure_threshold = 3, base_backoff = 10, max_backoff = 25), clock
+
+
+def test_opens_after_threshold(monkeypatch):
+    b, clock = breaker(monkeypatch)
+    for _ in range(2):
+        b.record_failure()
+    assert b.allow() and b.state == CLOSED
+    b.record_failure()
+    assert b.state == OPEN and not b.allow()
+
+
+def test_backoff_doubles_up_to_max(monkeypatch):
+    b, clock = breaker(monkeypatch)
+    for _ in range(3):
+        b.record_failure()
+    backoffs = []
+    for _ in range(3):
+        backoffs.append(b.retry_at - clock.now)
+        clock.now = b.retry_at
+        assert b.allow() and b.state == HALF_OPEN
+        b.record_failure()
+    assert backoffs == [10, 20, 25]
+
+
+def test_success_closes_and_resets(monkeypatch):
+    b, clock = breaker(monkeypatch)
+    for _ in range(3):
+        b.record_failure()
+    clock.now = b.retry_at
+    assert b.allow()
+    b.record_success()
+    assert b.state == CLOSED and b.status() == {'state': CLOSED, 'failures': 0, 'retry_in': 0}
+    for _ in range(3):
+        b.record_failure()
+    assert b.retry_at - clock.now == 10
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import random
+import pytest
+from drivers import driver_co2
+from simulatedHardware import CM1107Model, SimulatedI2cBus, SimulatedSMBus
+
+
+class BadChecksumModel(CM1107Model):
+    """
+    CM1107 whose measuring results fail their checksum, as the sensors of
+    the current hw/sw version do.
+    """
+
+    def frame(self):
+        frame = super().frame()
+        if self.command == 0x01:
+            frame[-1] ^= 0xFF
+        return frame
+
+
+@pytest.fixture(autouse = True)
+def no_waits(monkeypatch):
+    waits = []
+    monkeypatch.setattr(driver_co2, 'read_cmd_delay', 0)
+    monkeypatch.setattr(driver_co2, 'wait', waits.append)
+    return waits
+
+
+def stream(model, **kwargs):
+    return driver_co2.init(0, SimulatedSMBus(SimulatedI2cBus(0, [model], 0)), **kwargs)
+
+
+def test_read_frame():
+    co2 = stream(CM1107Model(random.Random(0), co2 = 800))
+    assert co2.serial_number == '12345678901234567890'
+    assert 700 < driver_co2.read(co2) < 900
+    assert co2.checksum_errors == 0 and co2.status['preheating'] is False
+
+
+def test_checksum_mismatch_is_only_logged_by_default():
+    co2 = stream(BadChecksumModel(random.Random(0)))
+    assert driver_co2.read(co2) != -999
+    assert co2.checksum_errors == 1
+
+
+def test_checksum_mismatch_is_dropped_when_verified(no_waits):
+    co2 = stream(BadChecksumModel(random.Random(0)), check_checksum = True)
+    assert driver_co2.read(co2) == -999
+    assert co2.checksum_errors == driver_co2.max_retries
+    assert no_waits == [driver_co2.retry_delay] * (driver_co2.max_retries - 1)
+
+
+def test_sensor_error_is_retried(no_waits):
+    co2 = stream(CM1107Model(random.Random(0), status = 1 << driver_co2.STATUS_BITS['sensor_error']))
+    assert driver_co2.read(co2) == -999
+    assert co2.status['sensor_error']
+    assert len(no_waits) == driver_co2.max_retries - 1
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import os
+import importlib
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def modules(folder, prefix = ''):
+    return sorted(prefix + name[:-3] for name in os.listdir(folder) if name.endswith('.py') and name != '__init__.py')
+
+
+@pytest.mark.parametrize('module', modules(SRC) + modules(os.path.join(SRC, 'drivers'), 'drivers.'))
+def test_import(module, tmp_path, monkeypatch):
+    # main.py opens app.log in the working directory when it is imported
+    monkeypatch.chdir(tmp_path)
+    importlib.import_module(module)
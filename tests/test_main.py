@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import importlib
+import pytest
+from sensorReading import SensorReading, FIELD_NAMES
+
+START = b'\xcb\xda'
+END = b'\xbc\x0a'
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    # main.py opens app.log in the working directory when it is imported
+    monkeypatch.chdir(tmp_path)
+    main = importlib.import_module('main')
+    monkeypatch.setattr(main.time, 'sleep', lambda seconds: None)
+    return main
+
+
+class Serial:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(data)
+
+
+def reading(**values):
+    return SensorReading([values.get(name) for name in FIELD_NAMES], 1000.0)
+
+
+def received(frame):
+    assert frame.startswith(START) and frame.endswith(END)
+    return frame.hex()[:-2]
+
+
+def test_frames_keep_the_old_format_by_default(main):
+    payload = main.encode_reading(reading(temperature = 21.5, humidity = 40, co2 = 800), 2)
+    ser = Serial()
+    main.send_data(ser, 'A1B2', [(1000.0, payload), (1060.0, payload)])
+    assert len(ser.frames) == 2
+    parsed = main.parse_lora_data(received(ser.frames[0]))
+    assert parsed['UniqueID'] == '"A1B2'
+    assert parsed['CO2'] == '800' and parsed['NOx'] == '-999'
+    assert parsed['AQI'] == '2' and parsed['Age'] is None
+
+
+def test_frame_age_is_the_age_of_the_reading(main, monkeypatch):
+    monkeypatch.setattr(main.time, 'time', lambda: 1100.0)
+    payload = main.encode_reading(reading(co2 = 800), 1)
+    ser = Serial()
+    main.send_data(ser, 'A1B2', [(1000.0, payload), (1100.0, payload), (1200.0, payload)], frame_age = True)
+    ages = [main.parse_lora_data(received(frame))['Age'] for frame in ser.frames]
+    assert ages == ['100', '0', '0']
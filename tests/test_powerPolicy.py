@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import pytest
+from powerPolicy import PowerPolicy, BATTERY_PLUGGED, BATTERY_NOT_PLUGGED
+
+
+class Handler:
+    """
+    Stands in for SensorHandler: the battery read and the applied modes.
+    """
+
+    def __init__(self, battery):
+        self.battery = battery
+        self.modes = []
+
+    def read_battery(self, max_age = None):
+        return self.battery
+
+    def set_power_mode(self, mode):
+        self.modes.append(mode.name)
+
+
+def test_modes_follow_the_battery():
+    policy = PowerPolicy()
+    assert policy.select(80, BATTERY_PLUGGED).name == 'normal'
+    assert policy.select(20, BATTERY_PLUGGED).name == 'saving'
+    assert policy.select(80, BATTERY_NOT_PLUGGED).name == 'saving'
+    assert policy.select(10, BATTERY_NOT_PLUGGED).name == 'critical'
+    assert policy.select(-999, BATTERY_NOT_PLUGGED).name == 'critical'
+
+
+def test_hysteresis():
+    policy = PowerPolicy(low_level = 30, critical_level = 15, hysteresis = 5)
+    handler = Handler((12, BATTERY_NOT_PLUGGED))
+    assert policy.update(handler).name == 'critical'
+    handler.battery = (17, BATTERY_NOT_PLUGGED)
+    assert policy.update(handler).name == 'critical'
+    handler.battery = (21, BATTERY_NOT_PLUGGED)
+    assert policy.update(handler).name == 'saving'
+    assert handler.modes == ['critical', 'saving']
+
+
+def test_fault_or_failed_read_keeps_the_mode():
+    policy = PowerPolicy()
+    handler = Handler((50, BATTERY_NOT_PLUGGED))
+    assert policy.update(handler).name == 'saving'
+    handler.battery = (-999, 3) # charger fault
+    assert policy.update(handler).name == 'saving'
+    handler.battery = -999
+    assert policy.update(handler).name == 'saving'
+    assert handler.modes == ['saving']
+
+
+def test_from_config():
+    policy = PowerPolicy.from_config({'lowLevel': 40, 'modes': {'saving': {'uplinkBatch': 3}}})
+    assert policy.low_level == 40
+    assert policy.modes['saving'].uplink_batch == 3
+    assert policy.modes['saving'].skip == ('SGP41',)
+    with pytest.raises(ValueError):
+        PowerPolicy.from_config({'modes': {'turbo': {}}})
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+from drivers.ringbuffer import RingBuffer, read_records
+
+
+def test_append_wraps_and_keeps_newest(tmp_path):
+    ring = RingBuffer(str(tmp_path / 'ring.bin'), '<IH', 3)
+    for i in range(5):
+        ring.append(i, i * 10)
+    assert len(ring) == 3
+    assert ring.read_all() == [(2, 20), (3, 30), (4, 40)]
+    ring.close()
+
+
+def test_records_survive_reopen(tmp_path):
+    path = str(tmp_path / 'ring.bin')
+    ring = RingBuffer(path, '<IH', 4)
+    ring.append(1, 2)
+    ring.close()
+    ring = RingBuffer(path, '<IH', 4)
+    assert ring.read_all() == [(1, 2)]
+    ring.close()
+
+
+def test_other_layout_is_reinitialised(tmp_path):
+    path = str(tmp_path / 'ring.bin')
+    ring = RingBuffer(path, '<IH', 4)
+    ring.append(1, 2)
+    ring.close()
+    ring = RingBuffer(path, '<IH', 8)
+    assert ring.read_all() == []
+    ring.close()
+
+
+def test_read_records_does_not_change_the_file(tmp_path):
+    path = tmp_path / 'ring.bin'
+    ring = RingBuffer(str(path), '<IH', 3)
+    for i in range(4):
+        ring.append(i, i)
+    ring.close()
+    data = path.read_bytes()
+    assert read_records(str(path), '<IH') == [(1, 1), (2, 2), (3, 3)]
+    assert path.read_bytes() == data
+
+
+def test_read_records_rejects_other_layouts(tmp_path):
+    path = tmp_path / 'ring.bin'
+    ring = RingBuffer(str(path), '<IH', 3)
+    ring.close()
+    with pytest.raises(ValueError):
+        read_records(str(path), '<II')
+    path.write_bytes(b'not a ring')
+    with pytest.raises(ValueError):
+        read_records(str(path), '<IH')
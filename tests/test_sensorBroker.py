@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import struct
+import pytest
+import sensorBroker
+from sensorBroker import SensorSegment, BrokerRequestHandler, SEGMENT_HEADER_SIZE
+from sensorReading import SensorReading, FIELD_NAMES
+
+
+def reading(timestamp, **values):
+    return SensorReading([values.get(name) for name in FIELD_NAMES], timestamp)
+
+
+def test_segment_round_trip(tmp_path):
+    path = str(tmp_path / 'segment')
+    writer = SensorSegment(path, create = True)
+    reader = SensorSegment(path)
+    try:
+        assert reader.read() is None
+        writer.write(reading(100.0, co2 = 800, pm2_5 = 12.5))
+        latest = reader.read()
+        assert latest.timestamp == 100.0
+        assert latest.co2 == 800 and latest.pm2_5 == 12.5
+        assert latest.voc is None and not latest.is_valid('voc')
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_segment_of_other_version_is_rejected(tmp_path):
+    path = str(tmp_path / 'segment')
+    writer = SensorSegment(path, create = True)
+    writer.map[4] = 0xFF
+    writer.close()
+    with pytest.raises(ValueError):
+        SensorSegment(path)
+
+
+def test_reader_retries_until_checksum_matches(tmp_path, monkeypatch):
+    path = str(tmp_path / 'segment')
+    writer = SensorSegment(path, create = True)
+    reader = SensorSegment(path)
+    writer.write(reading(1.0, co2 = 500))
+    # A torn write: the new reading is visible before its checksum
+    good = bytes(writer.map[SEGMENT_HEADER_SIZE:])
+    writer.map[SEGMENT_HEADER_SIZE:SEGMENT_HEADER_SIZE + 8] = struct.pack('<d', 2.0)
+
+    def repair(seconds):
+        writer.map[SEGMENT_HEADER_SIZE:] = good
+
+    monkeypatch.setattr(sensorBroker.time, 'sleep', repair)
+    try:
+        assert reader.read().timestamp == 1.0
+    finally:
+        reader.close()
+        writer.close()
+
+
+class Broker:
+    def latest(self):
+        return reading(5.0, co2 = 700)
+
+
+class Server:
+    broker = Broker()
+
+
+def handle(*lines):
+    handler = BrokerRequestHandler.__new__(BrokerRequestHandler)
+    handler.server = Server()
+    handler.rfile = io.BytesIO(b''.join(line + b'\n' for line in lines))
+    handler.wfile = io.BytesIO()
+    handler.handle()
+    return [json.loads(line) for line in handler.wfile.getvalue().splitlines()]
+
+
+def test_get_command():
+    answer, = handle(b'{"cmd": "get", "fields": ["co2"]}')
+    assert answer == {'timestamp': 5.0, 'values': {'co2': 700}}
+
+
+def test_bad_commands_get_an_error():
+    answers = handle(b'[1, 2]', b'"get"', b'{"cmd": "get", "fields": "co2"}', b'{"cmd": "get", "fields": ["ozone"]}',
+                     b'{"cmd": "reboot"}', b'not json')
+    assert all('error' in answer for answer in answers) and len(answers) == 6
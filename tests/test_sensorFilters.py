@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sensorReading import SensorReading, FIELD_NAMES
+from sensorFilters import HampelFilter, EmaFilter, RateLimitFilter, FilterStage
+
+
+def reading(timestamp, **values):
+    return SensorReading([values.get(name) for name in FIELD_NAMES], timestamp)
+
+
+def test_hampel_replaces_spike_by_median():
+    hampel = HampelFilter(5, 3.0)
+    outputs = [hampel.update(value, t) for t, value in enumerate([10, 11, 10, 12, 500, 11])]
+    assert outputs[4] == 11
+    assert outputs[5] == 11
+
+
+def test_hampel_keeps_steps_within_min_deviation():
+    hampel = HampelFilter(5, 3.0, minDeviation = 5)
+    for t in range(5):
+        hampel.update(10, t)
+    assert hampel.update(14, 5) == 14
+
+
+def test_hampel_median_matches_sorted_window():
+    hampel = HampelFilter(4)
+    values = [5, 1, 9, 3, 7, 2]
+    for t, value in enumerate(values):
+        hampel.update(value, t)
+    window = sorted(values[-4:])
+    assert hampel.median() == (window[1] + window[2]) / 2
+
+
+def test_ema():
+    ema = EmaFilter(0.5)
+    assert ema.update(10, 0) == 10
+    assert ema.update(20, 1) == 15
+
+
+def test_rate_limit():
+    limit = RateLimitFilter(10)
+    assert limit.update(400, 0) == 400
+    assert limit.update(1000, 2) == 420
+    assert limit.update(300, 3) == 410
+
+
+def test_stage_filters_once_per_sample():
+    stage = FilterStage({'co2': [RateLimitFilter(10)]})
+    assert stage.apply(reading(0, co2 = 400)).co2 == 400
+    first = stage.apply(reading(1, co2 = 1000, pm2_5 = 8))
+    assert first.co2 == 410 and first.pm2_5 == 8 and first.timestamp == 1
+    # The same sample read again from the cache is not filtered twice
+    assert stage.apply(reading(1, co2 = 1000)).co2 == 410
+
+
+def test_stage_passes_invalid_fields():
+    stage = FilterStage({'co2': [EmaFilter(0.5)]})
+    stage.apply(reading(0, co2 = 400))
+    assert stage.apply(reading(1)).co2 is None
+    assert stage.apply(reading(2, co2 = 600)).co2 == 500
+
+
+def test_stage_rejects_unknown_fields():
+    with pytest.raises(ValueError):
+        FilterStage({'ozone': [EmaFilter()]})
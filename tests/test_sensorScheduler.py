@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from samplingEngine import SamplingEngine
+from sensorScheduler import SensorScheduler, SchedulerJob, LatestValueCache
+
+
+def wait_until(predicate, timeout = 5):
+    end = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_cache_entries():
+    cache = LatestValueCache()
+    assert cache.get('CM1107') == -999
+    assert cache.get_entry('CM1107') == (-999, None)
+    cache.update('CM1107', 800, 12.5)
+    assert cache.get('CM1107') == 800
+    assert cache.get_entry('CM1107') == (800, 12.5)
+
+
+def run_scheduler(jobs, cache, predicate):
+    engine = SamplingEngine()
+    scheduler = SensorScheduler(engine, jobs, cache)
+    scheduler.start()
+    try:
+        return wait_until(predicate)
+    finally:
+        scheduler.stop()
+        engine.shutdown()
+
+
+def test_jobs_fill_the_cache():
+    cache = LatestValueCache()
+    jobs = [SchedulerJob('RHT', 0.01, lambda: (21.5, 40.0), ['SHT30', 'SHT40']),
+            SchedulerJob('CM1107', 0.01, lambda: 800)]
+    assert run_scheduler(jobs, cache, lambda: cache.get('SHT40') == 40.0 and cache.get('CM1107') == 800)
+    assert cache.get('SHT30') == 21.5
+
+
+def test_failed_job_invalidates_all_its_names():
+    def fail():
+        raise OSError('bus error')
+
+    cache = LatestValueCache()
+    cache.update('SHT30', 21.5)
+    cache.update('SHT40', 40.0)
+    jobs = [SchedulerJob('RHT', 10, fail, ['SHT30', 'SHT40'])]
+    assert run_scheduler(jobs, cache, lambda: cache.get('SHT30') == -999 and cache.get('SHT40') == -999)
+
+
+def test_busy_job_skips_its_slot():
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 1
+
+    engine = SamplingEngine()
+    scheduler = SensorScheduler(engine, [SchedulerJob('PM2008', 0.01, slow)], LatestValueCache())
+    scheduler.start()
+    try:
+        assert wait_until(lambda: calls)
+        time.sleep(0.1)
+        assert len(calls) == 1
+    finally:
+        release.set()
+        scheduler.stop()
+        engine.shutdown()
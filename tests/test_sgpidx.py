@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import pytest
+from drivers import sgpidx
+from drivers.sgpidx import GasIndexEngine
+
+
+def engine(tmp_path, measurement_type, snapshot = True):
+    folder = str(tmp_path / measurement_type)
+    snapshotFile = folder + '/state.bin' if snapshot else None
+    return GasIndexEngine(measurement_type, 100, folder, folder + '/history.bin', snapshotFile)
+
+
+def test_voc_snapshot_is_restored(tmp_path):
+    voc = engine(tmp_path, 'VOC')
+    for _ in range(50):
+        voc.process(30000)
+    voc.save_snapshot()
+    states = voc.get_states()
+
+    restored = engine(tmp_path, 'VOC')
+    assert restored.get_states() == states
+
+
+def test_stale_voc_snapshot_is_ignored(tmp_path, monkeypatch):
+    voc = engine(tmp_path, 'VOC')
+    voc.process(30000)
+    voc.save_snapshot()
+    monkeypatch.setattr(sgpidx, 'SNAPSHOT_MAX_AGE', -1)
+    assert not engine(tmp_path, 'VOC').load_snapshot()
+
+
+def test_corrupt_voc_snapshot_is_ignored(tmp_path):
+    voc = engine(tmp_path, 'VOC')
+    voc.process(30000)
+    voc.save_snapshot()
+    with open(voc.snapshotFile, 'r+b') as f:
+        f.write(b'X')
+    assert not engine(tmp_path, 'VOC').load_snapshot()
+
+
+def test_nox_has_no_snapshot(tmp_path):
+    with pytest.raises(ValueError):
+        engine(tmp_path, 'NOX')
+    nox = engine(tmp_path, 'NOX', snapshot = False)
+    assert isinstance(nox.process(15000), int)
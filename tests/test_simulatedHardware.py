@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import busAccess
+from drivers import driver_sgp4x
+from sensorUtils import SensorHandler
+from sensorInventory import SENSOR_ADDRESSES
+from simulatedHardware import SimulatedHardware
+
+
+@pytest.fixture
+def simulated(tmp_path):
+    """
+    Returns a function creating a SensorHandler on simulated hardware,
+    the Linux I2C devices are used again after the test.
+    """
+    handlers = []
+
+    def create(**kwargs):
+        hardware = SimulatedHardware(busClock = 0, dataRoot = str(tmp_path), **kwargs)
+        handler = SensorHandler(hardware = hardware)
+        handlers.append(handler)
+        return hardware, handler
+
+    yield create
+    for handler in handlers:
+        handler.close()
+    busAccess.use_hardware(None)
+
+
+def test_data_files_stay_in_data_root(tmp_path):
+    hardware = SimulatedHardware(dataRoot = str(tmp_path))
+    assert hardware.dataRoot == str(tmp_path)
+    for path in (driver_sgp4x.vocBufferFile, driver_sgp4x.noxBufferFile, driver_sgp4x.vocSnapshotFile):
+        assert path.startswith(str(tmp_path) + os.sep)
+    assert SimulatedHardware().dataRoot != str(tmp_path)
+
+
+def test_handler_reads_every_sensor(simulated, tmp_path):
+    hardware, handler = simulated()
+    assert handler.inventory.present_sensors() == list(SENSOR_ADDRESSES)
+    reading = handler.handler()
+    for name in ('co2', 'pm2_5', 'temperature', 'humidity'):
+        assert reading.is_valid(name), name
+    assert hardware.transfers() > 0
+
+
+def test_absent_sensor_is_not_read(simulated):
+    hardware, handler = simulated(absent = (SENSOR_ADDRESSES['CM1107'],))
+    assert not handler.inventory.is_present('CM1107')
+    assert handler.inventory.is_present('PM2008')
+    reading = handler.handler()
+    assert not reading.is_valid('co2')
+    assert reading.is_valid('pm2_5')
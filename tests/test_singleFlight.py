@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+import pytest
+from singleFlight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    release = threading.Event()
+    calls = []
+
+    def read():
+        calls.append(1)
+        release.wait(5)
+        return 42
+
+    flight = SingleFlight(read)
+    results = []
+    threads = [threading.Thread(target = lambda: results.append(flight.get())) for _ in range(8)]
+    threads[0].start()
+    while flight.future is None:
+        time.sleep(0.001)
+    # The others arrive while the first call is in flight and wait for it
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 8
+    assert len(calls) == 1
+
+
+def test_result_is_cached_for_max_age():
+    calls = []
+    flight = SingleFlight(lambda: calls.append(1) or len(calls), max_age = 60)
+    assert flight.get() == 1
+    assert flight.get() == 1
+    assert flight.get(max_age = 0) == 2
+    flight.invalidate()
+    assert flight.get() == 3
+
+
+def test_uncacheable_results_are_not_cached():
+    results = iter([-999, (80, 1)])
+    flight = SingleFlight(lambda: next(results), max_age = 60, cacheable = lambda r: r != -999)
+    assert flight.get() == -999
+    assert flight.get() == (80, 1)
+
+
+def test_exception_reaches_all_waiters_and_clears_the_call():
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise OSError('bus error')
+
+    flight = SingleFlight(fail)
+    errors = []
+
+    def call():
+        try:
+            flight.get()
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target = call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 5
+    assert flight.future is None
+    with pytest.raises(OSError):
+        flight.get()